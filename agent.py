@@ -1,10 +1,25 @@
-import cmath
 import math
 
+import numpy as np
+
+import angles
 from brain import Brain
+from instrumentation import logger
+from world import WorldState
 
 BRAIN_ARCHITECTURE = [10, 10, 3]
 MUTATION_RATE = 0.1
+TURN = 15 # degrees an agent turns left or right per tick
+
+def state_field(name:str):
+    """Property that reads and writes the agent's row of its WorldState"""
+    def getter(self):
+        return getattr(self.state, name)[self.row]
+
+    def setter(self, value):
+        getattr(self.state, name)[self.row] = value
+
+    return property(getter, setter)
 
 # Agent composed of single layer nn
 # has a position and velocity
@@ -12,6 +27,10 @@ MUTATION_RATE = 0.1
 class Agent:
     """A agent that moves around in the arena.
 
+    The agent is a lightweight handle: its position, speed, direction and fitness live in a row
+    of a WorldState. Until it is added to an arena that is a private single row state, afterwards
+    it is the arena's state.
+
     Attributes:
         arena: The arena the agent is in.
         x: The x coordinate of the agent.
@@ -19,20 +38,52 @@ class Agent:
         speed: The speed of the agent.
         direction: The direction the agent is facing.
         brain: the neural net object that computes what the agent should do
+        state: the WorldState holding the agent's attributes
+        row: the agent's row in state (and in the arena's population of brains)
     """
-    def __init__(self, arena, x:float, y:float, speed=10, direction=270, brain=None):
+    x = state_field("x")
+    y = state_field("y")
+    speed = state_field("speed")
+    # 0-359 based on degrees, kept in that range by move
+    direction = state_field("direction")
+    fitness = state_field("fitness")
+
+    def __init__(self, arena, x:float, y:float, speed=10, direction=270, brain=None, rng=None):
         self.arena = arena
+        self.state = WorldState(1)
+        self.row = 0
         self.x = x
         self.y = y
         self.speed = speed
-        # 0-360 based on degrees
         self.direction = direction
         if brain == None:
-            self.brain = Brain(layers=BRAIN_ARCHITECTURE)
+            # a fresh brain like Arena.new_agent builds, drawn from the arena's generator unless rng is given
+            self.brain = Brain(arena.architecture, rng=arena.rng if rng is None else rng, config=arena.inference)
         else:
             self.brain = brain
 
-        self.fitness = 0
+    @classmethod
+    def handle(cls, arena, state:WorldState, row:int, brain):
+        """Return an agent for a row that already exists in state, without copying anything into it"""
+        agent = cls.__new__(cls)
+        agent.arena = arena
+        agent.state = state
+        agent.row = row
+        agent.brain = brain
+        return agent
+
+    def bind(self, state:WorldState, row:int):
+        """Move the agent's attributes into a row of a shared state"""
+        state.copy_row(row, self.state, self.row)
+        self.state = state
+        self.row = row
+
+    def detach(self):
+        """Move the agent's attributes out of a shared state into a private one"""
+        state = WorldState(1)
+        state.copy_row(0, self.state, self.row)
+        self.state = state
+        self.row = 0
 
     # returns three points that represent the agent's vision
     # one is the distance from the agent to the wall or goal in front
@@ -40,18 +91,9 @@ class Agent:
     # three is the distance 45 degress to the left
     def check_surroundings(self) -> list[float]:
         """Check the surroundings of the agent."""
-        res = []
-        # front = self.check_distance(self.direction)
-        # right = self.check_distance(self.direction + 45)
-        # left = self.check_distance(self.direction - 45)
-        #
-        # res.append(front[1])
-        # res.append(right[1])
-        # res.append(left[1])
-        for i in range(11):
-            res.append(self.check_distance(self.direction + i * 10 - 50)[1])
-
-        print(res)
+        res = self.arena.sense([self.x], [self.y], [self.direction])[0, :, 1].tolist()
+
+        logger.debug("agent %s vision %s", self.row, res)
         return res 
     
     def check_distance(self, direction:int):
@@ -95,14 +137,12 @@ class Agent:
 
         
         direction = int(direction % 90)
-        a = 1 / cmath.cos(math.radians(direction)).real * adj_a
-        b = 1 / cmath.cos(math.radians(90 - direction)).real * adj_b
-        opp_a = cmath.tan(math.radians(direction)).real * adj_a
-        opp_b = cmath.tan(math.radians(90 - direction)).real * adj_b
+        a = angles.SEC[direction] * adj_a
+        b = angles.SEC[90 - direction] * adj_b
+        opp_a = angles.TAN[direction] * adj_a
+        opp_b = angles.TAN[90 - direction] * adj_b
 
         # print(f"Status report: adj_a = {adj_a}, adj_b = {adj_b}, opp_a = {opp_a}, opp_b = {opp_b}, a = {a}, b = {b}")
-        # print(f"cmath.acos(math.radians(direction)).real = {cmath.cos(math.radians(direction)).real}")
-        # print(f"cmath.acos(math.radians(90 - direction)).real = {cmath.cos(math.radians(90 - direction)).real}")
         # print(f"direction = {direction}, quadrant = {quadrant}")
         if adj_b > opp_a:
             return a, 0
@@ -136,9 +176,8 @@ class Agent:
 
     def convert_to_line(self, direction):
         """ Return the starting coordinates and vector of a line segment from the starting point to the end of the line segment"""
-        x1 = 1000 * cmath.cos(math.radians(direction)).real 
-        y1 = 1000 * cmath.sin(math.radians(direction)).real
-        # print(direction, cmath.cos(math.radians(direction)).real, cmath.sin(math.radians(direction)).real)
+        x1 = 1000 * angles.cos(direction)
+        y1 = 1000 * angles.sin(direction)
         return (x1,y1)
 
     def check_goal_collision(self,direction):
@@ -167,18 +206,29 @@ class Agent:
 
     def update_position(self, rng):
         decision = self.brain.feedforward(self.check_surroundings()) 
-        self.x = self.x + self.speed * math.cos(math.radians(self.direction))
-        self.y = self.y + self.speed * math.sin(math.radians(self.direction))
         choice = rng.choice([0, 1, 2], p=decision)
+        self.move(choice)
+
+        logger.debug("agent %s decision %s choice %s", self.row, decision, choice)
+
+    def move(self, choice:int):
+        """Step forward along the current direction and then turn according to the brain's choice
+
+        Keyword arguments:
+        choice -- 0 turns left, 1 keeps going straight and 2 turns right
+        """
+        direction = self.direction % 360
+        dx = angles.COS[direction]
+        dy = angles.SIN[direction]
+        distance = float(self.arena.travel(np.array([self.x]), np.array([self.y]), np.array([dx]), np.array([dy]),
+                                           np.array([self.speed * self.arena.timestep]))[0])
+        self.x = self.x + distance * dx
+        self.y = self.y + distance * dy
         if choice == 0:
-            self.direction = self.direction - 15
-        elif choice == 1:
-            self.direction = self.direction
+            direction = direction - self.arena.turn
         elif choice == 2:
-            self.direction = self.direction + 15
-
-        # print(choice)
-        print(decision)
+            direction = direction + self.arena.turn
+        self.direction = angles.normalize(direction)
 
     def get_position(self):
         return self.x, self.y
@@ -194,11 +244,11 @@ class Agent:
     def copy(self):
         return Agent(self.arena, self.x, self.y, self.speed, self.direction, brain=self.brain.copy())
 
-    def mutate(self):
-        self.brain = self.brain.mutate(MUTATION_RATE)
+    def mutate(self, rng=None):
+        self.brain = self.brain.mutate(self.arena.mutation_rate, rng=self.arena.rng if rng is None else rng)
 
-    def crossover(self, other):
-        offspring = self.brain.crossover(other.brain)
+    def crossover(self, other, rng=None):
+        offspring = self.brain.crossover(other.brain, rng=self.arena.rng if rng is None else rng)
         new_agent = Agent(self.arena, self.x, self.y, self.speed, self.direction, brain=offspring)
         # print(new_agent.brain)
         return new_agent
@@ -209,8 +259,5 @@ def polar_to_cartesian(r, theta):
     r: magnitude
     theta: angle in degrees
     """
-
-    x = r * cmath.cos(theta * cmath.pi / 180)
-    y = r * cmath.sin(theta * cmath.pi / 180)
-    return (x.real, y.real)
+    return (float(r * angles.cos(theta)), float(r * angles.sin(theta)))
 
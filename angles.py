@@ -0,0 +1,44 @@
+import numpy as np
+
+"""
+Notes:
+    - Headings are whole degrees (agents turn in 15 degree steps and rays sit at whole degree
+    offsets from the heading), so every trig value the simulation needs is one of 360 entries that
+    are computed once here and looked up afterwards.
+    - Lookups wrap the angle into 0-359 first, so any integer works. Non integer angles fall back to
+    computing the value.
+"""
+
+DEGREES = np.arange(360)
+RADIANS = np.radians(DEGREES)
+COS = np.cos(RADIANS)
+SIN = np.sin(RADIANS)
+with np.errstate(divide="ignore"):
+    TAN = np.tan(RADIANS)
+    SEC = 1 / COS
+
+def normalize(degrees):
+    """Wrap angles into 0-359"""
+    return degrees % 360
+
+def lookup(table:np.ndarray, func, degrees):
+    degrees = np.asarray(degrees)
+    if degrees.dtype.kind in "iu":
+        return table[degrees % 360]
+    return func(np.radians(degrees))
+
+def cos(degrees):
+    """Cosine of angle(s) in degrees"""
+    return lookup(COS, np.cos, degrees)
+
+def sin(degrees):
+    """Sine of angle(s) in degrees"""
+    return lookup(SIN, np.sin, degrees)
+
+def tan(degrees):
+    """Tangent of angle(s) in degrees"""
+    return lookup(TAN, np.tan, degrees)
+
+def sec(degrees):
+    """Secant (1 / cosine) of angle(s) in degrees"""
+    return lookup(SEC, lambda radians: 1 / np.cos(radians), degrees)
@@ -1,8 +1,19 @@
-import pygame
+import logging
 import math
+import time
 import numpy as np
 
-from agent import Agent
+import angles
+from agent import Agent, BRAIN_ARCHITECTURE, MUTATION_RATE, TURN
+from instrumentation import Profiler, logger
+from inference import DEFAULT_CONFIG
+from metrics import generation_record
+from population import Population, mutate_topology, sample_choices, stack_brains
+from selection import FITNESS, SELECTION, truncation
+from seeding import spawn_seeds
+from sensors import cast_rays, ray_directions, sweep_moves
+from world import WorldState
+from world_objects import AgentGrid, WorldObjects
 
 # hyperparameters controlling some evolutionary alg stuff
 SURVIVORS = 8
@@ -12,6 +23,9 @@ CHILDREN = 20
 class Arena:
     """Arena class that contains all the agents and the goal
 
+    Every agent's position, direction, speed, fitness and status is stored in a row of
+    state, the Agent objects in roster are handles to those rows.
+
     Attributes:
         width: width of the arena
         height: height of the arena
@@ -19,8 +33,33 @@ class Arena:
         goal_y: y coordinate of the goal
         goal_width: width of the goal
         goal_height: height of the goal
-        agents: list of agents in the arena
-        finished_agents: list of agents that have reached the goal
+        roster: every agent in the arena, the agent at index i owns row i of state
+        state: WorldState holding the per-agent arrays
+        agents: list of agents in the arena that are still moving
+        finished_agents: list of agents that have reached the goal, in the order they got there
+        population: stacked brains of the roster (a MixedPopulation once architectures differ), rebuilt lazily whenever agents are added
+        generation: number of generations that have gone through select
+        architecture: layer sizes of the brains of newly created agents
+        fitness_mode: how fitness scores agents, one of selection.FITNESS
+        selection_mode: how parents are drawn from the survivors, one of selection.SELECTION
+        ticks: ticks since the last reset
+        finish_ticks: the tick each entry of finish_order reached the goal on
+        goal_distance: distance of every agent to the goal when it was last scored, None if the scores came without one
+        topology_rate: probability of each child getting a structural mutation (adding or removing a node or layer), 0 keeps every architecture fixed
+        inference: InferenceConfig (activation, precision, backend) the brains run with
+        profiler: timers and counters around the phases of a tick, disabled by default
+        objects: extra goals and obstacles on top of the main goal, see world_objects.WorldObjects
+        agent_sight: how far along their vision rays agents see other agents' bodies (which look like obstacles), None for agents that can't see each other
+        agent_grid: world_objects.AgentGrid of the agents acting this tick, rebuilt lazily for agent_sight
+        metrics: optional metrics.MetricsWriter that select hands a record of every generation to
+        recorder: optional recorder.Recorder that update_agents hands every tick to
+        survivors: how many agents select keeps
+        newbies: how many fresh random agents select adds
+        children: how many children select breeds from the survivors
+        mutation_rate: probability of each parameter of a child (or a mutated agent) getting noise
+        timestep: how much time a tick covers, agents move speed * timestep and turn TURN * timestep degrees per tick
+        scenarios: rows of state per brain of population, row i is driven by brain i // scenarios (see scenarios.py)
+        turnover_time: time.perf_counter() of the last select, used to time generations
     """
     def __init__(self, width, height, goal_x, goal_y, goal_width, goal_height, rng):
         self.width = width
@@ -29,11 +68,49 @@ class Arena:
         self.goal_y = goal_y
         self.goal_width = goal_width
         self.goal_height = goal_height
-        self.agents = []
-        self.finished_agents = []
+        self.roster = []
+        self.state = WorldState()
+        self.finish_order = []
+        self.finish_ticks = []
+        self.goal_distance = None
+        self.population = None
+        self.generation = 0
+        self.architecture = BRAIN_ARCHITECTURE
+        self.topology_rate = 0.0
+        self.survivors = SURVIVORS
+        self.newbies = NEWBIES
+        self.children = CHILDREN
+        self.mutation_rate = MUTATION_RATE
+        self.timestep = 1.0
+        self.scenarios = 1
+        self.fitness_mode = "distance"
+        self.selection_mode = "roulette"
+        self.ticks = 0
+        self.inference = DEFAULT_CONFIG
+        self.profiler = Profiler()
+        self.objects = WorldObjects(width, height)
+        self.agent_sight = None
+        self.agent_grid = None
+        self.metrics = None
+        self.recorder = None
+        self.turnover_time = time.perf_counter()
         self.start_x = 475
         self.start_y = 475
-        self.rng = rng # global random numpy generator
+        self.rng = rng # global random numpy generator, root of every random draw in the arena
+
+    @property
+    def agents(self) -> list:
+        return [self.roster[row] for row in np.flatnonzero(self.state.active)]
+
+    @property
+    def finished_agents(self) -> list:
+        return [self.roster[row] for row in self.finished_rows()]
+
+    def finished_rows(self) -> np.ndarray:
+        """Rows of the agents that reached the goal, in the order they reached it."""
+        if not self.finish_order:
+            return np.zeros(0, dtype=int)
+        return np.concatenate(self.finish_order)
 
     def change_goal(self, goal_x, goal_y, goal_width, goal_height):
         """Changes the goal."""
@@ -42,100 +119,279 @@ class Arena:
         self.goal_width = goal_width
         self.goal_height = goal_height
 
+    def new_agent(self) -> Agent:
+        """Creates an agent at the start position with a random brain of the arena's architecture."""
+        return Agent(self, self.start_x, self.start_y)
+
     def add_agent(self, agent=None):
         """Adds an agent to the arena."""
         if agent == None:
-            agent = Agent(self, self.start_x, self.start_y)
+            agent = self.new_agent()
         # print(f"Adding agent with brain: {agent.brain}")
-        self.agents.append(agent)
+        self.add_agents([agent])
+
+    def add_agents(self, agents:list):
+        """Adds several agents to the arena, growing the state once."""
+        for agent, row in zip(agents, self.state.extend(len(agents))):
+            agent.bind(self.state, row)
+            self.roster.append(agent)
+        self.population = None
+
+    def load_population(self, population:Population):
+        """Replaces the agents with one fresh agent at the start position per brain of the population."""
+        for agent in self.roster:
+            agent.detach()
+        self.state = WorldState()
+        self.finish_order = []
+        self.finish_ticks = []
+        self.roster = []
+        for row in self.state.extend(len(population)):
+            agent = Agent(self, self.start_x, self.start_y, brain=population.brain(row))
+            agent.bind(self.state, row)
+            self.roster.append(agent)
+        self.population = population
+
+    def build_population(self):
+        """Stacks the brains of the roster so they can be evaluated in one batch."""
+        self.population = stack_brains([agent.brain for agent in self.roster], self.inference)
 
     def update_agents(self):
         """Updates the position of all the agents in the arena."""
-        for agent in self.agents:
+        profiler = self.profiler
+        self.ticks += 1
+        with profiler.phase("check_goal"):
             self.check_goal()
+        with profiler.phase("check_death"):
             self.check_death()
-            agent.update_position(rng=self.rng)
+        rows = np.flatnonzero(self.state.active)
+        if len(rows):
+            self.act(rows)
+        if self.recorder is not None:
+            with profiler.phase("record"):
+                self.recorder.record(self)
+
+    def act(self, rows):
+        """Lets the agents in rows sense, decide and move."""
+        if self.population is None:
+            self.build_population()
+
+        profiler = self.profiler
+        state = self.state
+        profiler.count("agent_ticks", len(rows))
+        with profiler.phase("sense"):
+            if self.agent_sight:
+                self.index_agents(rows)
+            vision = self.sense(state.x[rows], state.y[rows], state.direction[rows], rows)
+        with profiler.phase("think"):
+            decisions = self.think(rows, vision[:, :, 1])
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("agents %s vision %s decisions %s", rows, vision[:, :, 1], decisions)
+        with profiler.phase("move"):
+            self.move(rows, sample_choices(decisions, self.rng))
+
+    def sense(self, x, y, direction, rows=None) -> np.ndarray:
+        """Casts every agent's vision rays at once, see sensors.cast_rays. rows picks the goals of a goal per row."""
+        vision = cast_rays(x, y, direction, self.width, self.height, self.goal_rect(rows), objects=self.objects)
+        if self.agent_sight and rows is not None:
+            dx, dy = ray_directions(direction)
+            distance = self.agent_grid.cast(x, y, dx, dy, self.world_of(rows))
+            closer = distance < vision[..., 0]
+            vision[..., 0][closer] = distance[closer]
+            vision[..., 1][closer] = 0
+        return vision
+
+    def index_agents(self, rows) -> None:
+        """Rebuilds agent_grid from the positions of the agents in rows, the bodies the others can see this tick."""
+        if self.agent_grid is None or self.agent_grid.sight != self.agent_sight:
+            self.agent_grid = AgentGrid(self.width, self.height, self.agent_sight)
+        state = self.state
+        self.agent_grid.update(state.x[rows], state.y[rows], rows, self.world_of(rows))
+
+    def world_of(self, rows):
+        """Returns which scenario each row plays, so agents only see agents of their own scenario. None without scenarios."""
+        return rows % self.scenarios if self.scenarios > 1 else None
+
+    def think(self, rows, inputs) -> np.ndarray:
+        """Runs the brains driving the given rows on their inputs and returns their decisions.
+
+        Only the active rows are passed in, so only their brains run. With every row active there is
+        nothing to gather: the brains run on their parameters in place, each brain on the inputs of
+        all of its scenarios at once.
+        """
+        population = self.population
+        if len(rows) < len(self.state):
+            return population.feedforward(inputs, rows // self.scenarios if self.scenarios > 1 else rows)
+        if self.scenarios > 1:
+            return population.feedforward(inputs.reshape(len(population), self.scenarios, -1)).reshape(len(rows), -1)
+        return population.feedforward(inputs)
+
+    def goal_rect(self, rows=None) -> tuple:
+        """(x, y, width, height) of the goal, of the given rows when it is an array per row (see scenarios.py)."""
+        goal = (self.goal_x, self.goal_y, self.goal_width, self.goal_height)
+        if rows is None:
+            return goal
+        return tuple(value[rows] if isinstance(value, np.ndarray) else value for value in goal)
+
+    @property
+    def turn(self) -> int:
+        """Degrees an agent turns per tick, TURN scaled by the timestep."""
+        return int(round(TURN * self.timestep))
+
+    def travel(self, x, y, dx, dy, length, rows=None) -> np.ndarray:
+        """How far moves of the given length get before entering the goal or an object, see sensors.sweep_moves."""
+        return sweep_moves(x, y, dx, dy, length, self.goal_rect(rows), self.objects)
+
+    def move(self, rows, choices):
+        """Moves the agents in rows forward and turns them, the batched version of Agent.move.
+
+        Moves are swept, an agent that passes through the goal or an obstacle stops inside it.
+        """
+        state = self.state
+        direction = state.direction[rows]
+        dx = angles.COS[direction]
+        dy = angles.SIN[direction]
+        distance = self.travel(state.x[rows], state.y[rows], dx, dy, state.speed[rows] * self.timestep, rows)
+        state.x[rows] += distance * dx
+        state.y[rows] += distance * dy
+        state.direction[rows] = angles.normalize(direction + (choices - 1) * self.turn)
 
     def check_death(self):
-        """Checks if any agents have died."""
-        for agent in self.agents:
-            if agent.x < 0 or agent.x > self.width or agent.y < 0 or agent.y > self.height:
-                self.agents.remove(agent) 
+        """Checks if any agents have died (left the arena or ran into an obstacle)."""
+        state = self.state
+        outside = (state.x < 0) | (state.x > self.width) | (state.y < 0) | (state.y > self.height)
+        if len(self.objects):
+            outside |= self.objects.contains(state.x, state.y, "obstacle")
+        state.alive &= ~(outside & state.active)
     
     def check_goal(self):
         """Check if an agent has reached the goal and remove from the arena if so."""
-        for agent in self.agents:
-            if agent.x > self.goal_x and agent.x < self.goal_x + self.goal_width:
-                if agent.y > self.goal_y and agent.y < self.goal_y + self.goal_height:
-                    self.agents.remove(agent)
-                    self.finished_agents.append(agent)
+        state = self.state
+        inside = (state.x > self.goal_x) & (state.x < self.goal_x + self.goal_width)
+        inside &= (state.y > self.goal_y) & (state.y < self.goal_y + self.goal_height)
+        if len(self.objects):
+            inside |= self.objects.contains(state.x, state.y, "goal")
+        arrived = np.flatnonzero(inside & state.active)
+        if len(arrived):
+            state.finished[arrived] = True
+            self.finish_order.append(arrived)
+            self.finish_ticks.append(self.ticks)
 
     def distance_to_goal(self, agent):
         """Calculates the distance between an agent and the goal."""
         return math.sqrt((agent.x - self.goal_x) ** 2 + (agent.y - self.goal_y) ** 2)
 
     def fitness(self):
-        """Calculates the fitness of each agent."""
-        for agent in self.agents:
-            agent.fitness = 1 / (1 + self.distance_to_goal(agent) ** 2)
-        for agent in self.finished_agents:
-            agent.fitness = 1
+        """Calculates the fitness of each agent, see selection.FITNESS for the available fitness_modes."""
+        state = self.state
+        state.fitness[:] = FITNESS[self.fitness_mode](self)
+        self.goal_distance = np.hypot(state.x - self.goal_x, state.y - self.goal_y)
+
+    def assign_fitness(self, fitness, finished, alive=None, distance=None):
+        """Overwrites the fitness of every agent with scores computed elsewhere (e.g. other arenas).
+
+        finished marks the agents that count as finished, ranked by their position in the roster.
+        distance is the matching distance of every agent to the goal, None if there is none to report.
+        """
+        state = self.state
+        self.goal_distance = distance
+        state.fitness[:] = fitness
+        state.alive[:] = True if alive is None else alive
+        state.finished[:] = state.alive & finished
+        self.finish_order = [np.flatnonzero(state.finished)]
+        self.finish_ticks = [self.ticks]
 
     def mutate(self):
-        for agent in self.agents:
-            agent.mutate()
-        for agent in self.finished_agents:
-            agent.mutate()
+        for row in np.flatnonzero(self.state.alive):
+            self.roster[row].mutate(self.rng)
+        # brains that were shared with a copy got new arrays instead of writing into the population
+        self.population = None
+
+    def select(self, survivor_count=None, new_boys=None, children=None):
+        """Performs the selection process for the agent, counts default to the arena's survivors, newbies and children."""
+        survivor_count = self.survivors if survivor_count is None else survivor_count
+        new_boys = self.newbies if new_boys is None else new_boys
+        children = self.children if children is None else children
+        now = time.perf_counter()
+        if self.metrics is not None and self.metrics.due(self.generation):
+            self.metrics.write(generation_record(self, now - self.turnover_time))
+        self.turnover_time = now
+        if self.recorder is not None:
+            self.recorder.end_generation()
 
-    def select(self, survivor_count=SURVIVORS, new_boys=NEWBIES, children=CHILDREN):
-        """Performs the selection process for the agent."""
         # get top 10
-        if len(self.finished_agents) >= survivor_count:
-            self.agents = self.finished_agents[:survivor_count]
+        finished = self.finished_rows()
+        if len(finished) >= survivor_count:
+            survivors = finished[:survivor_count]
+        else:
+            active = np.flatnonzero(self.state.active)
+            ranked = active[truncation(self.state.fitness[active], survivor_count - len(finished))]
+            survivors = np.concatenate([ranked, finished])
+
+        # generate new agents through crossover and mutation of the whole population at once
+        if self.population is None:
+            self.build_population()
+        if len(survivors):
+            draw = SELECTION[self.selection_mode]
+            parents = survivors[draw(self.state.fitness[survivors], (children, 2), self.rng)]
         else:
-            i = len(self.finished_agents)
-            self.agents.sort(key=lambda x: x.fitness, reverse=True)
-            self.agents = self.agents[:survivor_count-i]
-            for agent in self.finished_agents:
-                self.agents.append(agent)
-
-        self.finished_agents = []
-        probabilities = np.asarray([a.fitness for a in self.agents])
-        # print(probabilities)
-        probabilities = probabilities / probabilities.sum()
-        # print(probabilities)
-        # generate new agents through mutation
-        children_list = []
-        for _ in range(children):
-            parent_1 = self.rng.choice(self.agents, p=probabilities).copy()
-            parent_2 = self.rng.choice(self.agents, p=probabilities).copy()
-            new_agent = parent_1.crossover(parent_2)
-            # print(f"parent1's brain: {parent_1.brain}, parent2's brain: {parent_2.brain}, new agent's brain: {new_agent.brain}")
-            new_agent.mutate()
-            children_list.append(new_agent)
-            # print("does it come here")
-
-        for i in range(new_boys + survivor_count - len(self.agents)):
-            self.add_agent()
-
-        for agent in children_list:
-            self.add_agent(agent)
+            parents = np.zeros((0, 2), dtype=int)
+        offspring = self.population.reproduce(parents[:, 0], parents[:, 1], self.mutation_rate, self.rng)
+        if self.topology_rate > 0:
+            offspring = mutate_topology(offspring, self.topology_rate, self.rng)
 
+        # drop everyone who didn't survive, moving their attributes out of the shared state in one go,
+        # and compact the state down to the survivors
+        state = self.state
+        dropped = np.ones(len(self.roster), dtype=bool)
+        dropped[survivors] = False
+        dropped = np.flatnonzero(dropped)
+        detached = state.take(dropped)
+        for i, row in enumerate(dropped):
+            self.roster[row].state = detached
+            self.roster[row].row = i
+
+        # children start where their first parent is
+        child_start = state.take(parents[:, 0])
+
+        self.roster = [self.roster[row] for row in survivors]
+        state.keep(survivors)
+        state.alive[:] = True
+        state.finished[:] = False
+        for row, agent in enumerate(self.roster):
+            agent.row = row
+        self.finish_order = []
+        self.finish_ticks = []
+
+        self.add_agents([self.new_agent() for _ in range(new_boys + survivor_count - len(survivors))])
+
+        rows = state.extend(len(offspring))
+        state.x[rows], state.y[rows] = child_start.x, child_start.y
+        state.speed[rows], state.direction[rows] = child_start.speed, child_start.direction
+        self.roster.extend(Agent.handle(self, state, row, offspring.brain(i)) for i, row in enumerate(rows))
+        self.population = None
+        self.generation += 1
+
+    def spawn_seeds(self, count:int) -> list:
+        """Spawns independent seed sequences from the arena's generator for work done elsewhere."""
+        return spawn_seeds(self.rng, count)
+
+    def random_start(self):
+        """Picks a random starting position and direction shared by all the agents."""
+        x = self.rng.integers(200, self.width-200)
+        y = self.rng.integers(200, self.height-200)
+        direction = self.rng.integers(0,359)
+        return x, y, direction
 
     def reset(self, random=False):
         """Resets the arena."""
         if random:
-            x = self.rng.integers(200, self.width-200)
-            y = self.rng.integers(200, self.height-200)
-            direction = self.rng.integers(0,359)
+            x, y, direction = self.random_start()
         else:
             x = self.start_x
             y = self.start_y
             direction = 0
 
-        for agent in self.agents:
-            agent.x = x
-            agent.y = y
-            agent.direction = direction
-
-
+        self.state.x[:] = x
+        self.state.y[:] = y
+        self.state.direction[:] = direction
+        self.ticks = 0
@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from arena import Arena
+from seeding import make_rng
+
+"""
+Notes:
+    - Benchmarks the simulation hot paths across population sizes and brain architectures and
+    saves the numbers as JSON, so runs on different commits can be compared with --compare.
+    - Timings are the best of several repeats, peak memory is measured in a separate untimed call
+    because tracemalloc slows everything down.
+    - Import times are measured in a fresh interpreter per repeat, since every worker process of a
+    sweep or ParallelEvaluator pays them again. They also check that the simulation modules never
+    pull in pygame.
+"""
+
+POPULATIONS = [100, 1000, 5000]
+ARCHITECTURES = [[10, 10, 3], [32, 32, 3]]
+TICKS = 20 # ticks per timed update_agents repeat
+REPEATS = 5
+# modules whose import is timed, and statements run after importing them (with a dummy video driver)
+IMPORTS = {
+    "arena": "",
+    "headless": "",
+    "sweep": "",
+    "game_ui": "game_ui.GameUI(arena.Arena(1000, 1000, 450, 50, 50, 50, rng=None), 700, 700)",
+}
+# modules that must not import pygame
+HEADLESS_MODULES = ["arena", "headless", "sweep"]
+
+def fresh_arena(population:int, architecture:list, seed:int=0) -> Arena:
+    """Return an arena with population agents at random starts, all driven by brains of the given architecture"""
+    rng = make_rng(seed)
+    arena = Arena(1000, 1000, 450, 50, 50, 50, rng=rng)
+    arena.architecture = architecture
+    arena.add_agents([arena.new_agent() for _ in range(population)])
+    scatter(arena)
+    return arena
+
+def scatter(arena:Arena) -> None:
+    """Put every agent back in the game at a random position and direction"""
+    state = arena.state
+    state.x[:] = arena.rng.uniform(100, arena.width - 100, len(state))
+    state.y[:] = arena.rng.uniform(100, arena.height - 100, len(state))
+    state.direction[:] = arena.rng.integers(0, 360, len(state))
+    state.alive[:] = True
+    state.finished[:] = False
+    arena.finish_order = []
+    arena.finish_ticks = []
+
+def measure(fn, setup=None, repeats:int=REPEATS) -> tuple:
+    """Return the best wall time of fn over several repeats and its peak traced memory in bytes"""
+    best = float("inf")
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+def result(name:str, population:int, architecture:list, unit:str, count:int, seconds:float, peak:int) -> dict:
+    return {
+        "name": name,
+        "population": population,
+        "architecture": architecture,
+        "unit": unit,
+        "per_second": count / seconds if seconds else float("inf"),
+        "seconds": seconds,
+        "peak_memory_bytes": peak,
+    }
+
+def bench_brain(architecture:list) -> list:
+    """Single agent paths: Brain.feedforward, Agent.check_surroundings and Agent.check_distance"""
+    arena = fresh_arena(1, architecture)
+    agent = arena.roster[0]
+    inputs = [0, 1, 0, 0, 1, 1, 0, 0, 0, 1, 0]
+    calls = 1000
+    res = []
+
+    seconds, peak = measure(lambda: [agent.brain.feedforward(inputs) for _ in range(calls)])
+    res.append(result("Brain.feedforward", 1, architecture, "calls", calls, seconds, peak))
+
+    seconds, peak = measure(lambda: [agent.check_surroundings() for _ in range(calls)])
+    res.append(result("Agent.check_surroundings", 1, architecture, "calls", calls, seconds, peak))
+
+    seconds, peak = measure(lambda: [agent.check_distance(agent.direction + i) for i in range(calls)])
+    res.append(result("Agent.check_distance", 1, architecture, "calls", calls, seconds, peak))
+    return res
+
+def bench_population(population:int, architecture:list, steps:int) -> list:
+    """Whole population paths: Arena.update_agents, Arena.select and a full generation"""
+    res = []
+    arena = fresh_arena(population, architecture)
+    arena.build_population()
+
+    def ticks():
+        for _ in range(TICKS):
+            arena.update_agents()
+    seconds, peak = measure(ticks, setup=lambda: scatter(arena))
+    res.append(result("Arena.update_agents", population, architecture, "ticks", TICKS, seconds, peak))
+
+    # keep the population the same size from one generation to the next
+    survivors = max(population // 4, 1)
+    newbies = population // 20
+    children = population - survivors - newbies
+
+    def select():
+        arena.fitness()
+        arena.select(survivors, newbies, children)
+    seconds, peak = measure(select, setup=lambda: scatter(arena))
+    res.append(result("Arena.select", population, architecture, "generations", 1, seconds, peak))
+
+    def generation():
+        for _ in range(steps):
+            arena.update_agents()
+        select()
+        arena.reset(random=True)
+    arena = fresh_arena(population, architecture)
+    seconds, peak = measure(generation, setup=lambda: scatter(arena), repeats=2)
+    res.append(result("generation", population, architecture, "generations", 1, seconds, peak))
+    return res
+
+def time_import(module:str, statement:str="", repeats:int=REPEATS) -> tuple:
+    """Return the best time to import module and run statement in a fresh interpreter, and whether that loaded pygame"""
+    code = ("import time, sys\n"
+            "start = time.perf_counter()\n"
+            f"import arena, {module}\n"
+            f"{statement}\n"
+            "print(time.perf_counter() - start, 'pygame' in sys.modules)")
+    env = {**os.environ, "SDL_VIDEODRIVER": "dummy", "PYGAME_HIDE_SUPPORT_PROMPT": "1"}
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = float("inf")
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=here, env=env).stdout
+        seconds, pygame = out.split()[-2:]
+        best = min(best, float(seconds))
+    return best, pygame == "True"
+
+def bench_imports() -> list:
+    """Time importing the simulation, the headless runners and the ui (including opening its window)"""
+    res = []
+    for module, statement in IMPORTS.items():
+        try:
+            seconds, pygame = time_import(module, statement)
+        except subprocess.CalledProcessError:
+            # the ui can't start without pygame installed
+            continue
+        if pygame and module in HEADLESS_MODULES:
+            print(f"warning: importing {module} loads pygame")
+        name = f"import {module}" + (" + start" if statement else "")
+        res.append(result(name, 0, [], "imports", 1, seconds, 0))
+    return res
+
+def run_suite(populations:list=POPULATIONS, architectures:list=ARCHITECTURES, steps:int=200) -> list:
+    res = bench_imports()
+    for architecture in architectures:
+        res += bench_brain(architecture)
+        for population in populations:
+            res += bench_population(population, architecture, steps)
+    return res
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(results:list, baseline:list) -> None:
+    """Print how much faster (>1) or slower (<1) every benchmark got relative to a baseline run"""
+    old = {(r["name"], r["population"], tuple(r["architecture"])): r for r in baseline}
+    for r in results:
+        before = old.get((r["name"], r["population"], tuple(r["architecture"])))
+        if before is None:
+            continue
+        speedup = r["per_second"] / before["per_second"]
+        memory = r["peak_memory_bytes"] / before["peak_memory_bytes"] if before["peak_memory_bytes"] else float("nan")
+        print(f"{r['name']:<26} pop {r['population']:>6} {str(r['architecture']):<12} speed x{speedup:6.2f}  memory x{memory:6.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the simulation hot paths")
+    parser.add_argument("--populations", type=int, nargs="+", default=POPULATIONS, help="population sizes to benchmark")
+    parser.add_argument("--steps", type=int, default=200, help="ticks per generation in the full generation benchmark")
+    parser.add_argument("--quick", action="store_true", help="only the smallest population and default architecture")
+    parser.add_argument("--output", default=None, help="save the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="JSON file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    populations = args.populations[:1] if args.quick else args.populations
+    architectures = ARCHITECTURES[:1] if args.quick else ARCHITECTURES
+    results = run_suite(populations, architectures, args.steps)
+
+    for r in results:
+        print(f"{r['name']:<26} pop {r['population']:>6} {str(r['architecture']):<12} "
+              f"{r['per_second']:>12.1f} {r['unit']}/s  peak {r['peak_memory_bytes'] / 1024:>10.1f} KiB")
+
+    report = {
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if baseline is not None:
+        print(f"\nCompared with {args.compare}:")
+        compare(results, baseline)
+
+if __name__ == '__main__':
+    main()
@@ -1,60 +1,80 @@
 import numpy as np
 from typing import List
+
+from inference import DEFAULT_CONFIG, InferenceConfig, inference_config
+from seeding import resolve_rng
 """
 Notes:
     - The brain is a multi-layer perceptron with a variable number of layers and nodes per layer.
     - the input is a set of 6 points that represent vision of the agent, first 3 points 
     are the depth perception of the agent at 3 different points, the other 3 points are whether the agent sees the goal at any of these points
+    - the number of hidden layers and their sizes can evolve, see mutate_structure
 """
+
+# limits for mutate_structure
+MAX_NODES = 32
+MAX_HIDDEN_LAYERS = 4
+
 class Brain:
     """the main neural network class
         weights: The weights of the multi-layer perceptron that drives the agent.
         biases: The biases of the multi-layer perceptron that drives the agent.
+        config: the InferenceConfig (activation, precision) feedforward runs with
+        scratch: buffers feedforward reuses for its intermediate results
+        shared: whether the weights and biases are read-only views shared with copies of this network
     """
-    def __init__(self, layers:list, weights=None, biases=None):
+    def __init__(self, layers:list, weights=None, biases=None, rng=None, config:InferenceConfig=None):
         """Receive a list of layers and initialize the weights and biases randomly
             Note that the last element in layers should be 3 since the output has 3 values
+
+            Keyword arguments:
+            rng -- the numpy generator to draw the initial weights from (default the shared fallback generator)
+            config -- the InferenceConfig to run with, new weights are stored in its precision (default DEFAULT_CONFIG)
         """
+        self.config = DEFAULT_CONFIG if config is None else config
+        self.scratch = None
+        self.shared = False
         if weights is not None and biases is not None:
             self.weights = weights
             self.biases = biases
         else:
             self.weights = [] # type: List[np.ndarray] 
             self.biases = [] # type: List[np.ndarray]
+            rng = resolve_rng(rng)
+            dtype = self.config.dtype
             for i in range(len(layers)):
                 if i == 0:
-                    self.weights.append(np.random.randn(11, layers[i]))
-                    self.biases.append(np.random.randn(layers[i]))
+                    self.weights.append(rng.standard_normal((11, layers[i])).astype(dtype, copy=False))
+                    self.biases.append(rng.standard_normal(layers[i]).astype(dtype, copy=False))
                 else:
-                    self.weights.append(np.random.randn(layers[i-1], layers[i]))
-                    self.biases.append(np.random.randn(layers[i]))
+                    self.weights.append(rng.standard_normal((layers[i-1], layers[i])).astype(dtype, copy=False))
+                    self.biases.append(rng.standard_normal(layers[i]).astype(dtype, copy=False))
 
     def get_softmax(self, output):
         """Return the softmax of the output of the network"""
-        return np.exp(output)/np.sum(np.exp(output))
+        exp = np.exp(output - np.max(output))
+        return exp / np.sum(exp)
     
-    def feedforward(self, inputs:list, activation="relu") -> np.ndarray:
+    def feedforward(self, inputs:list, activation=None) -> np.ndarray:
         """Feed the inputs through the network and return the output
 
+           The output lives in a scratch buffer that the next call overwrites, copy it to keep it.
+
            Keyword arguments:
               inputs -- the inputs to the network
-              activation -- the activation function to use (default "relu")
+              activation -- the activation function to use (default the one in config)
         """
-        # normalize inputs
-        curr = normalize(inputs)
-        
-        for i in range(len(self.weights)):
-            curr = np.dot(curr, self.weights[i]) + self.biases[i]
-            if activation == "relu":
-                curr = np.maximum(0, curr)
-        if np.sum(curr) > 500:
-            curr /= np.sum(curr)
-        curr = self.get_softmax(curr)
-        curr = np.nan_to_num(curr)
-
-        return curr 
+        config = self.config
+        if activation is not None and activation != config.activation:
+            config = inference_config(activation, str(config.dtype), config.backend)
+        scratch = self.scratch
+        if (scratch is None or scratch[0].dtype != config.dtype or len(scratch) != len(self.weights) + 1
+                or any(out.shape[0] != w.shape[1] for out, w in zip(scratch[1:], self.weights))):
+            widths = [len(inputs)] + [w.shape[1] for w in self.weights]
+            scratch = self.scratch = [np.empty(width, dtype=config.dtype) for width in widths]
+        return config.forward_one(self.weights, self.biases, inputs, scratch)
 
-    def mutate(self, mutate_probability_threshold:float, seed=None):
+    def mutate(self, mutate_probability_threshold:float, seed=None, rng=None):
         """Mutate the weights and biases of the network
         
         Use a Guassian distribution with mean 0 and standard deviation 0.1 to mutate the weights and biases
@@ -62,13 +82,15 @@ class Brain:
         Keyword arguments:
         mutate_probability_threshold -- The probability of a weight or bias being mutated
         seed -- The seed to use for the random number generator, mainly for testing
+        rng -- The generator to draw mutations from (default the shared fallback generator)
         """
 
         # When testing, use a seed to make sure the same mutations are applied to all networks
         if seed is not None:
             rng = np.random.default_rng(seed)
         else:
-            rng = np.random.default_rng()
+            rng = resolve_rng(rng)
+        self.own()
 
         for weights in self.weights:
             mutations = rng.normal(scale=0.1, size=tuple(weights.shape))
@@ -82,87 +104,172 @@ class Brain:
 
         return self
 
-    def crossover(self, other_brain):
+    def crossover(self, other_brain, rng=None):
         """Return a new network that is a crossover of this network and another network
 
+        The child has this network's shape. Where the other network has a matching layer (hidden
+        layers by position, output layer with output layer), every parameter the two layers both
+        have comes from either parent with equal probability; everything else comes from this network.
+
         Keyword arguments:
         other_brain -- The other network to crossover with
+        rng -- The generator that picks which parent each parameter comes from (default the shared fallback generator)
         """
-
-        assert len(self.weights) == len(other_brain.weights)
-        assert len(self.biases) == len(other_brain.biases)
+        rng = resolve_rng(rng)
+        pairs = self.matching_layers(other_brain)
 
         new_weights = []
         new_biases = []
 
         for i in range(len(self.weights)):
-            assert self.weights[i].shape == other_brain.weights[i].shape
-            new_weights.append(np.where(np.random.uniform(size=self.weights[i].shape) < 0.5, self.weights[i], other_brain.weights[i]))
+            new_weights.append(mix(self.weights[i], other_brain.weights[pairs[i]], rng.uniform(size=self.weights[i].shape) < 0.5))
 
         for i in range(len(self.biases)):
-            assert self.biases[i].shape == other_brain.biases[i].shape
-            new_biases.append(np.where(np.random.uniform(size=self.biases[i].shape) < 0.5, self.biases[i], other_brain.biases[i]))
+            new_biases.append(mix(self.biases[i], other_brain.biases[pairs[i]], rng.uniform(size=self.biases[i].shape) < 0.5))
 
-        res = Brain([], new_weights, new_biases)
+        res = Brain([], new_weights, new_biases, config=self.config)
         # print(res)
 
         return res
 
+    def matching_layers(self, other_brain) -> list:
+        """Return the index of the layer of other_brain that lines up with each of this network's layers"""
+        last = len(other_brain.weights) - 1
+        return [min(i, last - 1) if i < len(self.weights) - 1 and last > 0 else last for i in range(len(self.weights))]
+
+    @property
+    def layers(self) -> list:
+        """Number of nodes in every layer, the architecture this network would be built with"""
+        return [w.shape[1] for w in self.weights]
+
     def copy(self):
-        """Return a copy of the network"""
-        return Brain([], self.weights.copy(), self.biases.copy())
+        """Return a copy of the network
+
+        The copy is copy-on-write: both networks keep reading the same parameters through read-only
+        views, and whichever one is mutated first gets its own arrays (see own). Writing to the
+        shared arrays directly raises instead of silently changing the other network.
+        """
+        self.weights = [read_only(w) for w in self.weights]
+        self.biases = [read_only(b) for b in self.biases]
+        self.shared = True
+        res = Brain([], list(self.weights), list(self.biases), config=self.config)
+        res.shared = True
+        return res
+
+    def own(self):
+        """Give the network private, writable parameters if they are shared with a copy"""
+        if self.shared:
+            self.weights = [w.copy() for w in self.weights]
+            self.biases = [b.copy() for b in self.biases]
+            self.shared = False
 
     def remove_node(self, layer:int, node:int):
-        """Remove a node from the network"""
-
-        assert layer < len(self.weights), f"Layer {layer} does not exist in the network"
-        assert node < self.weights[layer].shape[1], f"Node {node} does not exist in layer {layer}"
-
-        # remove the node-th column of the weights and biases in the specified layer
-        weight_layer_with_node_to_remove = self.weights[layer]
-        weight_layer_with_node_to_remove = np.delete(weight_layer_with_node_to_remove, node, 1)
-        self.weights[layer] = weight_layer_with_node_to_remove
-
-        bias_layer_with_node_to_remove = self.biases[layer]
-        bias_layer_with_node_to_remove = np.delete(bias_layer_with_node_to_remove, node, 1)
-        self.biases[layer] = bias_layer_with_node_to_remove
-
-        # remove the node-th row of the weights and biases in the specified layer
-        next_weight_layer = self.weights[layer + 1]
-        next_weight_layer = np.delete(next_weight_layer, node, 0)
-        self.weights[layer + 1] = next_weight_layer
-
-        next_bias_layer = self.biases[layer + 1]
-        next_bias_layer = np.delete(next_bias_layer, node, 0)
-        self.biases[layer + 1] = next_bias_layer
-
-    def add_node(self, layer:int, node:int):
-        """Add a node to the network"""
-        assert layer >= len(self.weights) or layer < 0, f"Layer number {layer} out of bounds [0, {len(self.weights) - 1}]"
-        assert node >= len(self.weights[layer]) or node < 0, f"Node number {node} out of bounds [0, {len(self.weights[layer]) - 1}]"
-
-        # add a column of weights and biases to the specified layer
-        weight_layer_with_node_to_add = self.weights[layer]
-        random_node_weights = np.random.default_rng.normal(0, 1, weight_layer_with_node_to_add.shape[0])
-        weight_layer_with_node_to_add = np.insert(weight_layer_with_node_to_add, node, random_node_weights, 1)
-        self.weights[layer] = weight_layer_with_node_to_add
-
-        bias_layer_with_node_to_add = self.biases[layer]
-        random_node_biases = np.random.default_rng.normal(0, 1, bias_layer_with_node_to_add.shape[0])
-        bias_layer_with_node_to_add = np.insert(bias_layer_with_node_to_add, node, random_node_biases, 1)
-        self.biases[layer] = bias_layer_with_node_to_add
-
-        # add a row of weights and biases to the specified layer
-        next_weight_layer = self.weights[layer + 1]
-        next_weight_layer = np.insert(next_weight_layer, node, 0, 0)
-        self.weights[layer + 1] = next_weight_layer
-
-        next_bias_layer = self.biases[layer + 1]
-        next_bias_layer = np.insert(next_bias_layer, node, 0, 0)
-        self.biases[layer + 1] = next_bias_layer
-
-def normalize(v):
-    norm = np.linalg.norm(v)
-    if norm == 0: 
-       return v
-    return v / norm
+        """Remove a node from a hidden layer of the network"""
+
+        assert 0 <= layer < len(self.weights) - 1, f"Layer {layer} is not a hidden layer of the network"
+        assert 0 <= node < self.weights[layer].shape[1], f"Node {node} does not exist in layer {layer}"
+        assert self.weights[layer].shape[1] > 1, f"Layer {layer} only has one node left"
+
+        # remove the node-th column of the weights and the node-th bias in the specified layer
+        self.weights[layer] = np.delete(self.weights[layer], node, 1)
+        self.biases[layer] = np.delete(self.biases[layer], node, 0)
+
+        # remove the node-th row of the weights of the next layer, its input from the node
+        self.weights[layer + 1] = np.delete(self.weights[layer + 1], node, 0)
+
+    def add_node(self, layer:int, node:int=None, rng=None):
+        """Add a node to a hidden layer of the network
+
+        The node gets random input weights and bias and zero output weights, so the network
+        computes the same thing until mutation changes them.
+
+        Keyword arguments:
+        layer -- the hidden layer to add the node to
+        node -- the position of the new node in the layer (default the end)
+        rng -- the generator to draw the new weights from (default the shared fallback generator)
+        """
+        assert 0 <= layer < len(self.weights) - 1, f"Layer {layer} is not a hidden layer of the network"
+        width = self.weights[layer].shape[1]
+        node = width if node is None else node
+        assert 0 <= node <= width, f"Node number {node} out of bounds [0, {width}]"
+        rng = resolve_rng(rng)
+
+        # add a column of weights and a bias to the specified layer
+        self.weights[layer] = np.insert(self.weights[layer], node, rng.standard_normal(self.weights[layer].shape[0]), 1)
+        self.biases[layer] = np.insert(self.biases[layer], node, rng.standard_normal(), 0)
+
+        # add a row of zero weights to the next layer
+        self.weights[layer + 1] = np.insert(self.weights[layer + 1], node, 0, 0)
+
+    def add_layer(self, layer:int):
+        """Insert a hidden layer right after the given hidden layer
+
+        The new layer has as many nodes as the one before it and starts out as the identity, which
+        keeps the network computing the same thing with relu (its inputs are never negative).
+        """
+        assert 0 <= layer < len(self.weights) - 1, f"Layer {layer} is not a hidden layer of the network"
+        width = self.weights[layer].shape[1]
+        self.weights.insert(layer + 1, np.eye(width, dtype=self.weights[layer].dtype))
+        self.biases.insert(layer + 1, np.zeros(width, dtype=self.biases[layer].dtype))
+
+    def remove_layer(self, layer:int):
+        """Remove a hidden layer, folding its weights into the next layer as if it had no activation"""
+        assert 0 <= layer < len(self.weights) - 1, f"Layer {layer} is not a hidden layer of the network"
+        weights = self.weights.pop(layer)
+        biases = self.biases.pop(layer)
+        self.biases[layer] = biases @ self.weights[layer] + self.biases[layer]
+        self.weights[layer] = weights @ self.weights[layer]
+
+    def mutate_structure(self, rng=None, max_nodes:int=MAX_NODES, max_layers:int=MAX_HIDDEN_LAYERS) -> str:
+        """Apply one random structural mutation and return its name, None when none is possible
+
+        Picks evenly among adding a node, removing a node, adding a hidden layer and removing a
+        hidden layer, skipping the ones that would break the limits or remove the last hidden layer.
+
+        Keyword arguments:
+        rng -- the generator to draw the mutation from (default the shared fallback generator)
+        max_nodes -- most nodes a hidden layer may have
+        max_layers -- most hidden layers the network may have
+        """
+        rng = resolve_rng(rng)
+        hidden = self.layers[:-1]
+        options = []
+        if any(width < max_nodes for width in hidden):
+            options.append("add_node")
+        if any(width > 1 for width in hidden):
+            options.append("remove_node")
+        if hidden and len(hidden) < max_layers:
+            options.append("add_layer")
+        # keep at least one hidden layer so the network can still grow back
+        if len(hidden) > 1:
+            options.append("remove_layer")
+        if not options:
+            return None
+
+        choice = options[rng.integers(len(options))]
+        if choice == "add_node":
+            layer = rng.choice([i for i, width in enumerate(hidden) if width < max_nodes])
+            self.add_node(int(layer), rng=rng)
+        elif choice == "remove_node":
+            layer = int(rng.choice([i for i, width in enumerate(hidden) if width > 1]))
+            self.remove_node(layer, int(rng.integers(hidden[layer])))
+        elif choice == "add_layer":
+            self.add_layer(int(rng.integers(len(hidden))))
+        else:
+            self.remove_layer(int(rng.integers(len(hidden))))
+        return choice
+
+def read_only(array:np.ndarray) -> np.ndarray:
+    """Return a view of the array that can't be written through"""
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+def mix(own:np.ndarray, other:np.ndarray, mask:np.ndarray) -> np.ndarray:
+    """Return a copy of own that takes other's values where mask is False, within the part both arrays cover"""
+    if own.shape == other.shape:
+        return np.where(mask, own, other)
+    res = own.copy()
+    overlap = tuple(slice(0, min(a, b)) for a, b in zip(own.shape, other.shape))
+    res[overlap] = np.where(mask[overlap], own[overlap], other[overlap])
+    return res
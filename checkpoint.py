@@ -0,0 +1,115 @@
+import json
+import os
+
+import numpy as np
+
+from agent import BRAIN_ARCHITECTURE
+from arena import Arena
+from population import population_from_buffer
+from seeding import restore_rng, rng_state
+from world import WorldState
+
+"""
+Notes:
+    - A checkpoint is a single file: an 8 byte magic string, the length of a JSON header as a
+    little endian uint64, the JSON header, then every array as raw bytes aligned to 64 bytes.
+    - The header holds the brain layout (one per architecture once they differ), generation counter and RNG state, plus the dtype, shape
+    and offset of every array, so arrays can be memory mapped straight out of the file.
+"""
+
+MAGIC = b"SMWCKPT1"
+ALIGNMENT = 64
+
+def save_checkpoint(path:str, arena:Arena) -> None:
+    """Save the arena's whole population, their state, the generation counter and the RNG state
+
+    The file is written next to path and moved into place, so a crash never leaves a half written checkpoint.
+    """
+    if arena.population is None:
+        arena.build_population()
+
+    params, layout = arena.population.to_buffer()
+    arrays = {"params": np.ascontiguousarray(params)}
+    for name, _ in WorldState.FIELDS:
+        arrays[name] = np.ascontiguousarray(getattr(arena.state, name))
+
+    header = {
+        "layout": layout,
+        "architecture": arena.architecture or BRAIN_ARCHITECTURE,
+        "generation": arena.generation,
+        "rng": rng_state(arena.rng),
+        "arrays": {},
+    }
+
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += align(array.nbytes)
+    header_bytes = json.dumps(header).encode()
+    data_start = align(len(MAGIC) + 8 + len(header_bytes))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.array(len(header_bytes), dtype="<u8").tobytes())
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + header["arrays"][name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+def align(size:int) -> int:
+    """Round size up to the next multiple of ALIGNMENT"""
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+def read_header(path:str) -> tuple:
+    """Return the JSON header of a checkpoint and the offset at which its arrays start"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a smallworld checkpoint")
+        length = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+        return json.loads(f.read(length)), align(len(MAGIC) + 8 + length)
+
+def load_arrays(path:str, mmap:bool=True) -> tuple:
+    """Return the header and a dict of the arrays stored in a checkpoint
+
+    Keyword arguments:
+    path -- the checkpoint file
+    mmap -- map the arrays copy-on-write instead of reading them into memory, so only the pages
+            that are touched get loaded and writes never reach the file
+    """
+    header, data_start = read_header(path)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        shape = tuple(spec["shape"])
+        offset = data_start + spec["offset"]
+        if mmap and int(np.prod(shape)):
+            arrays[name] = np.memmap(path, dtype=dtype, mode="c", offset=offset, shape=shape)
+        else:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                arrays[name] = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+    return header, arrays
+
+def load_checkpoint(path:str, arena:Arena, mmap:bool=True) -> Arena:
+    """Replace the arena's agents, generation counter and RNG with the ones stored in a checkpoint
+
+    The brains' parameters stay memory mapped (see load_arrays), the small per-agent state is copied.
+    Parameters saved in another precision than the arena's inference config are converted to it,
+    which reads them into memory. The arena's architecture for new agents is restored as well.
+    """
+    header, arrays = load_arrays(path, mmap)
+    params = arrays["params"]
+    if params.dtype != arena.inference.dtype:
+        params = params.astype(arena.inference.dtype)
+    arena.architecture = list(header["architecture"])
+    arena.load_population(population_from_buffer(params, header["layout"], arena.inference))
+    for name, _ in WorldState.FIELDS:
+        getattr(arena.state, name)[:] = arrays[name]
+    arena.finish_order = [np.flatnonzero(arena.state.finished)]
+    arena.finish_ticks = [arena.ticks]
+    arena.generation = header["generation"]
+    arena.rng = restore_rng(header["rng"])
+    return arena
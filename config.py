@@ -0,0 +1,133 @@
+from agent import BRAIN_ARCHITECTURE, MUTATION_RATE
+from arena import CHILDREN, NEWBIES, SURVIVORS, Arena
+from inference import inference_config
+from seeding import make_rng
+
+"""
+Notes:
+    - A RunConfig holds every setting of a run that used to be a module constant or a command line
+    flag, so a run can be described, stored (as_dict) and rebuilt (build_arena) as one value.
+    - The module constants stay as the defaults.
+"""
+
+STARTING_POP = 30
+GENERATIONS = 100
+STEPS = 200
+GOAL = (450, 50, 50, 50)
+
+class RunConfig:
+    """Settings of one evolution run, see FIELDS for every setting and its default.
+
+    Attributes:
+        population: starting number of agents
+        survivors, newbies, children: how many agents every select keeps, adds fresh and breeds
+        mutation_rate: probability of each parameter of a child getting noise
+        architecture: layer sizes of the brains of new agents
+        topology_rate: probability of a child adding or removing a node or layer
+        generations: how many generations the run lasts at most
+        steps: ticks per generation
+        timestep: time a tick covers, e.g. 2 with half the steps simulates the same span in half the ticks
+        target: finished agents a generation needs for the run to count as solved
+        seed: seed of the run's generator, None for a random one
+        activation, precision, backend: the InferenceConfig the brains run with
+        fitness, selection: fitness and selection mode of the arena, see selection.py
+        scenarios: how many random starts every brain is evaluated in, see scenarios.ScenarioEvaluator
+        random_goal: whether every scenario also gets a random goal
+        width, height, goal: size of the arena and the (x, y, width, height) of its goal
+        objects: extra goals and obstacles, e.g. "rect 300 300 100 20; circle 700 200 40 goal", see WorldObjects.add_spec
+        agent_sight: how far agents see each other, None for agents that can't
+    """
+    FIELDS = {
+        "population": STARTING_POP,
+        "survivors": SURVIVORS,
+        "newbies": NEWBIES,
+        "children": CHILDREN,
+        "mutation_rate": MUTATION_RATE,
+        "architecture": tuple(BRAIN_ARCHITECTURE),
+        "topology_rate": 0.0,
+        "generations": GENERATIONS,
+        "steps": STEPS,
+        "timestep": 1.0,
+        "target": SURVIVORS,
+        "seed": None,
+        "activation": "relu",
+        "precision": "float64",
+        "backend": "numpy",
+        "fitness": "distance",
+        "selection": "roulette",
+        "scenarios": 1,
+        "random_goal": False,
+        "width": 1000,
+        "height": 1000,
+        "goal": GOAL,
+        "objects": "",
+        "agent_sight": None,
+    }
+
+    def __init__(self, **settings):
+        unknown = set(settings) - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"unknown settings {sorted(unknown)}, expected some of {list(self.FIELDS)}")
+        for name, default in self.FIELDS.items():
+            setattr(self, name, settings.get(name, default))
+        self.architecture = tuple(self.architecture)
+        self.goal = tuple(self.goal)
+
+    def __repr__(self):
+        changed = ", ".join(f"{name}={value!r}" for name, value in self.changes().items())
+        return f"RunConfig({changed})"
+
+    def __eq__(self, other):
+        return isinstance(other, RunConfig) and self.as_dict() == other.as_dict()
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def changes(self) -> dict:
+        """The settings that differ from their defaults"""
+        return {name: value for name, value in self.as_dict().items() if value != self.FIELDS[name]}
+
+    def replace(self, **changes) -> "RunConfig":
+        """Return a copy with some settings changed"""
+        return RunConfig(**{**self.as_dict(), **changes})
+
+    @classmethod
+    def parse(cls, name:str, text:str):
+        """Convert the text of a setting (e.g. from the command line) to the type of its default
+
+        Architectures and goals are written as numbers joined by "-", e.g. 10-10-3.
+        """
+        if name not in cls.FIELDS:
+            raise ValueError(f"unknown setting {name!r}, expected one of {list(cls.FIELDS)}")
+        default = cls.FIELDS[name]
+        if isinstance(default, tuple):
+            return tuple(int(value) for value in text.split("-"))
+        if isinstance(default, bool):
+            return text.lower() in ("1", "true", "yes")
+        if default is None:
+            return None if text.lower() == "none" else int(text)
+        return type(default)(text)
+
+    def build_arena(self, populate:bool=True, rng=None) -> Arena:
+        """Return an arena set up with these settings
+
+        Keyword arguments:
+        populate -- add population fresh agents (leave it out e.g. to load a checkpoint instead)
+        rng -- generator of the arena (default one made from seed)
+        """
+        arena = Arena(self.width, self.height, *self.goal, rng=make_rng(self.seed) if rng is None else rng)
+        arena.architecture = list(self.architecture)
+        arena.inference = inference_config(self.activation, self.precision, self.backend)
+        arena.topology_rate = self.topology_rate
+        arena.fitness_mode = self.fitness
+        arena.selection_mode = self.selection
+        arena.survivors = self.survivors
+        arena.newbies = self.newbies
+        arena.children = self.children
+        arena.mutation_rate = self.mutation_rate
+        arena.timestep = self.timestep
+        arena.objects.add_spec(self.objects)
+        arena.agent_sight = self.agent_sight
+        if populate:
+            arena.add_agents([arena.new_agent() for _ in range(self.population)])
+        return arena
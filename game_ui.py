@@ -1,29 +1,68 @@
+import functools
+
+import numpy as np
 import pygame
+import angles
 from arena import Arena
 from agent import Agent
+from recorder import Trajectory, frame_state
+from world_objects import CIRCLE
+
+# radius of the dot drawn for an agent and length of the line showing its direction
+AGENT_RADIUS = 5
+VELOCITY_LINE = 25
+FONT_SIZE = 30
+# ticks replay advances per frame at each playback speed
+REPLAY_SPEEDS = [1, 2, 4, 8, 16]
+
+@functools.lru_cache(maxsize=None)
+def load_font(size:int) -> pygame.font.Font:
+    """Return pygame's bundled font at the given size, loaded once per process
+
+    The bundled font needs no scan of the system's fonts, unlike SysFont.
+    """
+    pygame.font.init()
+    return pygame.font.Font(None, size)
 
 class GameUI:
-    """The main graphics/ui controller of the simulator"""
+    """The main graphics/ui controller of the simulator
+
+    render_frame draws incrementally: the static scene (arena border, goals, obstacles) is cached
+    in background and only rebuilt when the camera or the goals change, the stat texts are only
+    re-rendered when their values change, agents outside the camera are skipped, and only the
+    rectangles that changed since the last frame are pushed to the display.
+    """
     def __init__(self, arena:Arena, screen_width:int, screen_height:int) -> None:
-        pygame.init()
+        # only the modules the ui uses, pygame.init would also start audio, joysticks etc.
+        pygame.display.init()
+        pygame.font.init()
         self.screen_width = screen_width
         self.screen_height = screen_height
         self.cam_x = 0
         self.cam_y = 0
         self.arena = arena
         self.screen = pygame.display.set_mode((screen_width, screen_height))
-        self.font = pygame.font.SysFont('Comic Sans MS', 30)
+        self.font = load_font(FONT_SIZE)
+        self.background = None
+        self.background_key = None
+        self.stat_cache = {}
+        self.dirty = []
 
-    def update_stats(self, generation: int =0, highest: int =0, current: int=0) -> None:
-        """Update the stats display"""
-        gen_stat_display = self.font.render(f"Generation {generation}", False, (0, 0, 0))
-        self.screen.blit(gen_stat_display, (0, 0))
+    def stat_surface(self, label: str, value) -> pygame.Surface:
+        """Return the rendered text for a stat, only calling font.render when its value changed"""
+        cached = self.stat_cache.get(label)
+        if cached is None or cached[0] != value:
+            cached = (value, self.font.render(f"{label}{value}", False, (0, 0, 0)))
+            self.stat_cache[label] = cached
+        return cached[1]
 
-        high_stat_display = self.font.render(f"Highest: {highest}", False, (0, 0, 0))
-        self.screen.blit(high_stat_display, (0, 40))
-
-        cur_stat_display = self.font.render(f"Current: {current}", False, (0, 0, 0))
-        self.screen.blit(cur_stat_display, (0, 80))
+    def update_stats(self, generation: int =0, highest: int =0, current: int=0) -> list:
+        """Update the stats display and return the rectangles that were drawn over"""
+        return [
+            self.screen.blit(self.stat_surface("Generation ", generation), (0, 0)),
+            self.screen.blit(self.stat_surface("Highest: ", highest), (0, 40)),
+            self.screen.blit(self.stat_surface("Current: ", current), (0, 80)),
+        ]
 
     def draw(self, screen):
         """Draw the arena and the goal."""
@@ -34,6 +73,74 @@ class GameUI:
         pygame.draw.rect(screen,
                          (144, 238, 144),
                          (self.arena.goal_x-self.cam_x, self.arena.goal_y-self.cam_y, self.arena.goal_width, self.arena.goal_height))
+        self.draw_objects(screen)
+
+    def draw_objects(self, screen):
+        """Draw the extra goals (green) and obstacles (grey) of the arena."""
+        objects = self.arena.objects
+        for shape, kind, bounds, radius in zip(objects.shape, objects.kind, objects.bounds, objects.radius):
+            color = (144, 238, 144) if kind == objects.GOAL else (128, 128, 128)
+            x_min, y_min, x_max, y_max = bounds
+            if shape == CIRCLE:
+                pygame.draw.circle(screen, color, ((x_min + x_max) / 2 - self.cam_x, (y_min + y_max) / 2 - self.cam_y), radius)
+            else:
+                pygame.draw.rect(screen, color, (x_min - self.cam_x, y_min - self.cam_y, x_max - x_min, y_max - y_min))
+
+    def scene_key(self) -> tuple:
+        """Everything the cached background depends on"""
+        arena = self.arena
+        objects = arena.objects
+        return (self.cam_x, self.cam_y, arena.goal_x, arena.goal_y, arena.goal_width, arena.goal_height,
+                len(objects), objects.bounds.tobytes())
+
+    def invalidate(self) -> None:
+        """Force the next render_frame to redraw the whole screen"""
+        self.background_key = None
+
+    def render_frame(self, generation: int =0, highest: int =0, current: int=0, state=None) -> None:
+        """Draw one frame, pushing only the parts of the screen that changed to the display
+
+        state is the WorldState to draw the agents from, e.g. a snapshot from a SimulationThread,
+        and defaults to the arena's own.
+        """
+        screen = self.screen
+        key = self.scene_key()
+        if key != self.background_key:
+            if self.background is None:
+                self.background = pygame.Surface(screen.get_size())
+            self.draw(self.background)
+            self.background_key = key
+            screen.blit(self.background, (0, 0))
+            erased = [screen.get_rect()]
+        else:
+            # paint the background back over everything drawn last frame
+            erased = [screen.blit(self.background, rect, rect) for rect in self.dirty]
+
+        drawn = self.draw_agent_state(screen, state)
+        drawn += self.update_stats(generation=generation, highest=highest, current=current)
+        pygame.display.update(erased + drawn)
+        self.dirty = drawn
+
+    def draw_agent_state(self, screen, state=None) -> list:
+        """Draw every agent that is moving and in view straight from the state arrays (the arena's by default)
+
+        Returns the rectangles that were drawn over.
+        """
+        if state is None:
+            state = self.arena.state
+        rows = np.flatnonzero(state.active)
+        x = state.x[rows] - self.cam_x
+        y = state.y[rows] - self.cam_y
+        direction = state.direction[rows]
+        end_x = x + VELOCITY_LINE * angles.cos(direction)
+        end_y = y + VELOCITY_LINE * angles.sin(direction)
+        visible = self.check_objects_in_bounds(state.x[rows], state.y[rows], margin=VELOCITY_LINE)
+
+        drawn = []
+        for ax, ay, ex, ey in zip(x[visible].tolist(), y[visible].tolist(), end_x[visible].tolist(), end_y[visible].tolist()):
+            rect = pygame.draw.circle(screen, (255, 0, 0), (ax, ay), AGENT_RADIUS)
+            drawn.append(rect.union(pygame.draw.line(screen, (255, 0, 0), (ax, ay), (ex, ey), 1)))
+        return drawn
 
     def draw_agents(self, screen, agents: list[Agent]) -> None:
         """Draws all the agents in the arena."""
@@ -56,9 +163,77 @@ class GameUI:
     def update(self) -> None:
         pygame.display.flip()
 
-    def check_objects_in_bounds(self) -> None:
-        """Return whether given object(s) are within view bounds"""
-        
+    def check_objects_in_bounds(self, x, y, margin: float =0) -> np.ndarray:
+        """Return whether given object(s) are within view bounds
+
+        Keyword arguments:
+        x -- x coordinate(s) of the objects in arena space
+        y -- y coordinate(s) of the objects in arena space
+        margin -- how far outside the view an object may be and still count, e.g. its size
+        """
+        x = np.asarray(x) - self.cam_x
+        y = np.asarray(y) - self.cam_y
+        return (x >= -margin) & (x <= self.screen_width + margin) & (y >= -margin) & (y <= self.screen_height + margin)
+
+    def replay(self, trajectory:Trajectory, generation:int=None, fps:int=40) -> None:
+        """Play back a recorded trajectory until the window is closed, without simulating anything
 
+        space pauses, , and . step one tick back or forward, home / end jump to the first / last tick,
+        page up / page down switch to the previous / next recorded generation, + / - change the
+        playback speed and the arrow keys move the camera. The goal is taken from the recording.
+        """
+        generations = trajectory.generations
+        if not generations:
+            return
+        index = generations.index(generation) if generation in generations else 0
+        recording = trajectory.load(generations[index])
+        tick = 0
+        speed = 0
+        playing = True
+        state = None
+        clock = pygame.time.Clock()
+        camera = {pygame.K_LEFT: (-20, 0), pygame.K_RIGHT: (20, 0), pygame.K_UP: (0, -20), pygame.K_DOWN: (0, 20)}
 
+        while True:
+            ticks = len(recording["x"])
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key in [pygame.K_ESCAPE, pygame.K_q]):
+                    return
+                if event.type != pygame.KEYDOWN:
+                    continue
+                if event.key == pygame.K_SPACE:
+                    playing = not playing
+                elif event.key == pygame.K_PERIOD:
+                    tick, playing = tick + 1, False
+                elif event.key == pygame.K_COMMA:
+                    tick, playing = tick - 1, False
+                elif event.key == pygame.K_HOME:
+                    tick = 0
+                elif event.key == pygame.K_END:
+                    tick = ticks - 1
+                elif event.key in (pygame.K_PAGEUP, pygame.K_PAGEDOWN):
+                    index = (index + (1 if event.key == pygame.K_PAGEDOWN else -1)) % len(generations)
+                    recording = trajectory.load(generations[index])
+                    ticks = len(recording["x"])
+                    tick = 0
+                elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                    speed = min(speed + 1, len(REPLAY_SPEEDS) - 1)
+                elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    speed = max(speed - 1, 0)
+                elif event.key in camera:
+                    self.move_camera(*camera[event.key])
 
+            if not ticks:
+                clock.tick(fps)
+                continue
+            tick = min(max(tick, 0), ticks - 1)
+            state = frame_state(recording, tick, state)
+            self.arena.change_goal(*recording["goal"][tick].tolist())
+            self.render_frame(generation=generations[index] + 1, highest=int(recording["finished"][-1].sum()),
+                              current=int(state.finished.sum()), state=state)
+            caption = f"Replay: generation {generations[index] + 1}, tick {tick + 1}/{ticks}"
+            if caption != pygame.display.get_caption()[0]:
+                pygame.display.set_caption(caption)
+            if playing:
+                tick = min(tick + REPLAY_SPEEDS[speed], ticks - 1)
+            clock.tick(fps)
@@ -0,0 +1,217 @@
+import argparse
+import logging
+import os
+import time
+
+from arena import Arena
+from checkpoint import load_checkpoint, save_checkpoint
+from config import GENERATIONS, STARTING_POP, STEPS, RunConfig
+from inference import ACTIVATIONS, BACKENDS, DTYPES
+from instrumentation import Profiler, format_record
+from metrics import MetricsWriter
+from parallel import ParallelEvaluator
+from recorder import ENCODINGS, Recorder
+from scenarios import AGGREGATES, ScenarioEvaluator
+from scheduler import GenerationScheduler
+from selection import FITNESS, SELECTION
+
+CHECKPOINT_EVERY = 10
+
+def run_generation(arena:Arena, steps:int=STEPS, evaluator=None, scheduler:GenerationScheduler=None) -> dict:
+    """Simulate one generation, then score, select and reset the arena.
+
+    The generation ends early once every agent has died or finished. Returns a record describing
+    the generation before selection replaced the agents.
+
+    Keyword arguments:
+    arena -- the populated arena to evolve
+    steps -- how many ticks the generation lasts at most
+    evaluator -- optional ParallelEvaluator or ScenarioEvaluator that scores the agents in several scenarios instead of this one
+    scheduler -- optional GenerationScheduler that decides the number of ticks instead of steps
+    """
+    start = time.perf_counter()
+    profiler = arena.profiler
+    if evaluator is not None:
+        with profiler.phase("evaluate"):
+            ticks = evaluator.evaluate(arena, steps)
+    else:
+        if scheduler is not None:
+            ticks = scheduler.run(arena)
+        else:
+            ticks = 0
+            for ticks in range(1, steps + 1):
+                arena.update_agents()
+                if not arena.state.active.any():
+                    break
+        with profiler.phase("fitness"):
+            arena.fitness()
+
+    record = finish_generation(arena, start)
+    record["ticks"] = ticks
+    if scheduler is not None:
+        scheduler.end_generation(record["best_fitness"])
+    return record
+
+def finish_generation(arena:Arena, start:float) -> dict:
+    """Select the next generation of a scored arena and reset it, see run_generation
+
+    Keyword arguments:
+    arena -- the arena whose agents were just scored
+    start -- time.perf_counter() at the start of the generation
+    """
+    profiler = arena.profiler
+    scores = arena.state.fitness[arena.state.alive]
+    record = {
+        "finished": len(arena.finished_agents),
+        "best_fitness": float(scores.max()) if len(scores) else 0.0,
+        "mean_fitness": float(scores.mean()) if len(scores) else 0.0,
+    }
+    alive = len(scores)
+
+    with profiler.phase("select"):
+        arena.select()
+    arena.reset(random=True)
+    record["seconds"] = time.perf_counter() - start
+    profiler.end_generation(arena.generation, alive=alive, finished=record["finished"])
+    return record
+
+def run(arena:Arena, generations:int=GENERATIONS, steps:int=STEPS, callback=None, evaluator=None,
+        checkpoint:str=None, checkpoint_every:int=CHECKPOINT_EVERY, scheduler:GenerationScheduler=None) -> dict:
+    """Evolve the agents in the arena for a number of generations as fast as possible.
+
+    Keyword arguments:
+    arena -- the populated arena to evolve
+    generations -- how many generations to run
+    steps -- how many ticks each generation lasts
+    callback -- called with (generation, record) after every generation
+    evaluator -- optional ParallelEvaluator or ScenarioEvaluator, see run_generation
+    checkpoint -- path to save the population to every checkpoint_every generations and at the end
+    checkpoint_every -- how many generations to run between checkpoints
+    scheduler -- optional GenerationScheduler, see run_generation
+    """
+    start = time.perf_counter()
+    highest = 0
+    ticks = 0
+    record = None
+    for _ in range(generations):
+        record = run_generation(arena, steps, evaluator, scheduler)
+        highest = max(highest, record["finished"])
+        ticks += record["ticks"]
+        if callback is not None:
+            callback(arena.generation, record)
+        if checkpoint is not None and arena.generation % checkpoint_every == 0:
+            save_checkpoint(checkpoint, arena)
+    if checkpoint is not None:
+        save_checkpoint(checkpoint, arena)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "generations": generations,
+        "ticks": ticks,
+        "seconds": elapsed,
+        "ticks_per_second": ticks / elapsed if elapsed else float("inf"),
+        "highest": highest,
+        "last": record,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Evolve agents without opening a window")
+    parser.add_argument("--generations", type=int, default=GENERATIONS, help="number of generations to run")
+    parser.add_argument("--steps", type=int, default=STEPS, help="ticks per generation (generations end early once no agent is moving)")
+    parser.add_argument("--timestep", type=float, default=1.0, help="time every tick covers, e.g. --timestep 2 --steps 100 runs the same span in half the ticks")
+    parser.add_argument("--max-steps", type=int, default=None, help="grow the ticks per generation up to this when the best fitness stalls")
+    parser.add_argument("--stuck-window", type=int, default=None, help="retire agents that barely moved over this many ticks")
+    parser.add_argument("--population", type=int, default=STARTING_POP, help="starting number of agents")
+    parser.add_argument("--survivors", type=int, default=RunConfig.FIELDS["survivors"], help="agents kept by every selection")
+    parser.add_argument("--newbies", type=int, default=RunConfig.FIELDS["newbies"], help="fresh random agents added by every selection")
+    parser.add_argument("--children", type=int, default=RunConfig.FIELDS["children"], help="children bred by every selection")
+    parser.add_argument("--mutation-rate", type=float, default=RunConfig.FIELDS["mutation_rate"], help="probability of each parameter of a child getting noise")
+    parser.add_argument("--architecture", type=lambda text: RunConfig.parse("architecture", text), default=RunConfig.FIELDS["architecture"],
+                        help="layer sizes of the brains joined by -, e.g. 10-16-3")
+    parser.add_argument("--arenas", type=int, default=1, help="evaluate every generation in this many arenas with random starts")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes used when --arenas > 1 (default: all cores)")
+    parser.add_argument("--scenarios", type=int, default=1, help="evaluate every brain in this many random starts at once, in one process")
+    parser.add_argument("--aggregate", choices=sorted(AGGREGATES), default="mean", help="how the scores of a brain across --scenarios are combined")
+    parser.add_argument("--random-goal", action="store_true", help="also randomize the goal of every arena / scenario when --arenas or --scenarios > 1")
+    parser.add_argument("--objects", default="", help='extra goals and obstacles, e.g. "rect 300 300 100 20; circle 700 200 40 goal"')
+    parser.add_argument("--agent-sight", type=int, default=None, help="let agents see other agents' bodies this far along their vision rays")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the run, the same seed reproduces the same run")
+    parser.add_argument("--activation", choices=ACTIVATIONS, default="relu", help="activation of every layer of the brains")
+    parser.add_argument("--precision", choices=DTYPES, default="float64", help="float precision of the brains")
+    parser.add_argument("--backend", choices=BACKENDS, default="numpy", help="run the brains with numpy or the numba compiled kernel")
+    parser.add_argument("--fitness", choices=sorted(FITNESS), default="distance", help="how agents are scored")
+    parser.add_argument("--selection", choices=sorted(SELECTION), default="roulette", help="how parents are drawn from the survivors")
+    parser.add_argument("--topology-rate", type=float, default=0.0, help="probability of a child adding or removing a node or layer of its brain")
+    parser.add_argument("--checkpoint", default=None, help="file to save the population to periodically")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY, help="generations between checkpoints")
+    parser.add_argument("--resume", action="store_true", help="continue from --checkpoint if it exists")
+    parser.add_argument("--profile", action="store_true", help="print per phase timings every generation")
+    parser.add_argument("--profile-log", default=None, help="append per phase timings of every generation to this JSON lines file")
+    parser.add_argument("--metrics", default=None, help="append a record of every generation to this .jsonl or .csv file")
+    parser.add_argument("--metrics-every", type=int, default=1, help="only record every Nth generation")
+    parser.add_argument("--record", default=None, help="record every agent's trajectory to this file, see main.py --replay")
+    parser.add_argument("--record-every", type=int, default=1, help="only record every Nth generation")
+    parser.add_argument("--record-encoding", choices=ENCODINGS, default="float32", help="how recorded positions are stored")
+    parser.add_argument("--verbose", action="store_true", help="log per agent diagnostics (very noisy)")
+    parser.add_argument("--quiet", action="store_true", help="only print the final summary")
+    args = parser.parse_args()
+    if args.agent_sight is not None and args.agent_sight <= 0:
+        parser.error("--agent-sight must be positive")
+    if args.arenas > 1 and args.scenarios > 1:
+        parser.error("--arenas and --scenarios are two ways of evaluating in several scenarios, pick one")
+    if (args.arenas > 1 or args.scenarios > 1) and (args.max_steps or args.stuck_window):
+        parser.error("--max-steps and --stuck-window only apply to single arena runs, not --arenas or --scenarios")
+    if (args.arenas > 1 or args.scenarios > 1) and args.record:
+        parser.error("--record only covers single arena runs, not --arenas or --scenarios")
+
+    config = RunConfig(population=args.population, survivors=args.survivors, newbies=args.newbies, children=args.children,
+                       mutation_rate=args.mutation_rate, architecture=args.architecture, topology_rate=args.topology_rate,
+                       generations=args.generations, steps=args.steps, timestep=args.timestep, seed=args.seed, activation=args.activation,
+                       precision=args.precision, backend=args.backend, fitness=args.fitness, selection=args.selection,
+                       scenarios=args.scenarios, random_goal=args.random_goal, objects=args.objects, agent_sight=args.agent_sight)
+    resume = args.resume and args.checkpoint and os.path.exists(args.checkpoint)
+    try:
+        arena = config.build_arena(populate=not resume)
+    except ValueError as error:
+        parser.error(f"--objects: {error}")
+    if resume:
+        load_checkpoint(args.checkpoint, arena)
+        print(f"Resuming from generation {arena.generation} with {len(arena.roster)} agents")
+
+    def report(gen, record):
+        print(f"Generation {gen}: finished {record['finished']}, "
+              f"best {record['best_fitness']:.4f}, mean {record['mean_fitness']:.4f}, "
+              f"{record['seconds']:.3f}s")
+
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+    if args.profile or args.profile_log:
+        print_record = (lambda record: print(format_record(record))) if args.profile else None
+        arena.profiler = Profiler(True, callback=print_record, log_path=args.profile_log)
+    if args.metrics:
+        arena.metrics = MetricsWriter(args.metrics, every=args.metrics_every)
+    if args.record:
+        arena.recorder = Recorder(args.record, args.record_encoding, every=args.record_every)
+
+    callback = None if args.quiet else report
+    if args.scenarios > 1:
+        with ScenarioEvaluator(args.scenarios, args.random_goal, args.aggregate) as evaluator:
+            summary = run(arena, args.generations, args.steps, callback, evaluator, args.checkpoint, args.checkpoint_every)
+    elif args.arenas > 1:
+        with ParallelEvaluator(args.arenas, args.workers, args.random_goal) as evaluator:
+            summary = run(arena, args.generations, args.steps, callback, evaluator, args.checkpoint, args.checkpoint_every)
+    else:
+        scheduler = None
+        if args.max_steps or args.stuck_window:
+            scheduler = GenerationScheduler(args.steps, max_steps=args.max_steps or args.steps, stuck_window=args.stuck_window)
+        summary = run(arena, args.generations, args.steps, callback, None, args.checkpoint, args.checkpoint_every, scheduler)
+    arena.profiler.close()
+    if arena.metrics is not None:
+        arena.metrics.close()
+    if arena.recorder is not None:
+        arena.recorder.close()
+    print(f"Ran {summary['generations']} generations ({summary['ticks']} ticks) in {summary['seconds']:.2f}s, "
+          f"{summary['ticks_per_second']:.0f} ticks/s, highest finished {summary['highest']}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+import functools
+import math
+
+import numpy as np
+
+from instrumentation import logger
+
+"""
+Notes:
+    - An InferenceConfig fixes, once, everything Brain and Population used to decide on every call:
+    the activation, the float precision and whether inference runs as NumPy calls or as one fused
+    (Numba compiled) loop. Configs are cached, inference_config(...) with the same arguments
+    returns the same object.
+    - Both paths compute what Brain.feedforward always did: normalize the inputs, run the layers,
+    divide the outputs by their sum when it is over OUTPUT_CLAMP, then take the softmax. The softmax
+    subtracts the maximum first so it can't overflow into nan any more.
+    - Intermediate results go into scratch buffers owned by the caller and reused across calls, so
+    the returned decisions are only valid until the next call with the same buffers.
+    - The numba backend falls back to NumPy (with a warning) when numba isn't installed. numba is
+    only imported, and the kernel only compiled, the first time a numba config is made, since
+    importing it costs more than the rest of the simulation's imports together.
+"""
+
+ACTIVATIONS = ("relu", "linear", "tanh", "sigmoid")
+DTYPES = ("float64", "float32")
+BACKENDS = ("numpy", "numba")
+# outputs are divided by their sum when it goes over this, before the softmax
+OUTPUT_CLAMP = 500
+
+def relu(x:np.ndarray) -> None:
+    np.maximum(x, 0, out=x)
+
+def linear(x:np.ndarray) -> None:
+    pass
+
+def tanh(x:np.ndarray) -> None:
+    np.tanh(x, out=x)
+
+def sigmoid(x:np.ndarray) -> None:
+    np.negative(x, out=x)
+    with np.errstate(over="ignore"):
+        np.exp(x, out=x)
+    x += 1
+    np.reciprocal(x, out=x)
+
+# every activation applied to an array in place, by name
+ACTIVATE = {"relu": relu, "linear": linear, "tanh": tanh, "sigmoid": sigmoid}
+
+class InferenceConfig:
+    """How a network turns inputs into decisions, see inference_config.
+
+    Attributes:
+        activation: one of ACTIVATIONS, applied after every layer
+        activate: the function of ACTIVATE applying the activation to an array in place
+        dtype: numpy dtype parameters and intermediate results are kept in
+        backend: "numpy", or "numba" for the fused kernel
+    """
+    def __init__(self, activation:str="relu", dtype:str="float64", backend:str="numpy"):
+        if activation not in ACTIVATIONS:
+            raise ValueError(f"activation must be one of {ACTIVATIONS}, got {activation!r}")
+        if str(np.dtype(dtype)) not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}, got {dtype!r}")
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {BACKENDS}, got {backend!r}")
+        if backend == "numba" and load_numba() is None:
+            logger.warning("numba is not installed, running inference with numpy instead")
+            backend = "numpy"
+        self.activation = activation
+        self.dtype = np.dtype(dtype)
+        self.backend = backend
+        self.code = ACTIVATIONS.index(activation)
+        self.activate = ACTIVATE[activation]
+
+    def __repr__(self):
+        return f"InferenceConfig(activation={self.activation!r}, dtype={str(self.dtype)!r}, backend={self.backend!r})"
+
+    def normalize(self, x:np.ndarray) -> None:
+        """Scale every row of x to unit length in place, leaving all zero rows alone"""
+        norm = np.sqrt(np.einsum("ij,ij->i", x, x))[:, None]
+        np.divide(x, norm, out=x, where=norm != 0)
+
+    def decide(self, x:np.ndarray) -> None:
+        """Turn the raw outputs in every row of x into decision probabilities in place"""
+        total = x.sum(axis=1, keepdims=True)
+        np.divide(x, total, out=x, where=total > OUTPUT_CLAMP)
+        x -= x.max(axis=1, keepdims=True)
+        np.exp(x, out=x)
+        x /= x.sum(axis=1, keepdims=True)
+
+    def scratch(self, count:int, widths:list, scratch:list=None) -> list:
+        """Return buffers for count rows of every width in widths, reusing scratch when it is big enough"""
+        if (scratch is None or len(scratch) != len(widths) or len(scratch[0]) < count
+                or any(buffer.shape[1] != width or buffer.dtype != self.dtype for buffer, width in zip(scratch, widths))):
+            scratch = [np.empty((count, width), dtype=self.dtype) for width in widths]
+        return scratch
+
+    def forward(self, weights:list, biases:list, inputs, scratch:list) -> np.ndarray:
+        """Run a batch of inputs through the layers with NumPy and return the decisions (a view of scratch)
+
+        Keyword arguments:
+        weights -- per layer either one (in x out) matrix shared by every row or (brains x in x out) matrices,
+                   each used for rows / brains consecutive rows (the brain's inputs in several scenarios)
+        biases -- per layer either one (out) vector or (brains x out) vectors
+        inputs -- (rows x inputs) array
+        scratch -- buffers from self.scratch for the inputs and the output of every layer
+        """
+        count = len(inputs)
+        x = scratch[0][:count]
+        x[...] = inputs
+        self.normalize(x)
+        for layer, (w, b) in enumerate(zip(weights, biases)):
+            out = scratch[layer + 1][:count]
+            if w.ndim == 3:
+                np.matmul(x.reshape(len(w), -1, x.shape[1]), w, out=out.reshape(len(w), -1, out.shape[1]))
+            else:
+                np.matmul(x, w, out=out)
+            if b.ndim == 2:
+                grouped = out.reshape(len(b), -1, out.shape[1])
+                grouped += b[:, None, :]
+            else:
+                out += b
+            self.activate(out)
+            x = out
+        self.decide(x)
+        return x
+
+    def forward_one(self, weights:list, biases:list, inputs, scratch:list) -> np.ndarray:
+        """forward for a single input vector, with scalar reductions and (widths) shaped scratch buffers
+
+        Small vectors are dominated by per call overhead, so this skips everything forward needs to
+        handle a batch.
+        """
+        x = scratch[0]
+        x[...] = inputs
+        norm = math.sqrt(x.dot(x))
+        if norm != 0:
+            x /= norm
+        for layer, (w, b) in enumerate(zip(weights, biases)):
+            out = scratch[layer + 1]
+            np.matmul(x, w, out=out)
+            out += b
+            self.activate(out)
+            x = out
+        total = x.sum()
+        if total > OUTPUT_CLAMP:
+            x /= total
+        x -= x.max()
+        np.exp(x, out=x)
+        x /= x.sum()
+        return x
+
+    def fused(self, params:np.ndarray, layout:np.ndarray, rows:np.ndarray, inputs, scratch:list) -> np.ndarray:
+        """Run a batch of inputs through the flat parameter rows of a population with the fused kernel
+
+        Keyword arguments:
+        params -- (agents x parameters) matrix laid out as in population.Population
+        layout -- (layers x 2) int array of the inputs and outputs of every layer
+        rows -- the row of params every input belongs to
+        inputs -- (rows x inputs) array
+        scratch -- buffers from self.scratch for [inputs, widest layer, widest layer, outputs]
+        """
+        count = len(inputs)
+        x = scratch[0][:count]
+        x[...] = inputs
+        out = scratch[3][:count]
+        fused_kernel()(params, layout, rows, x, self.code, OUTPUT_CLAMP, scratch[1][0], scratch[2][0], out)
+        return out
+
+def fused_forward(params, layout, rows, inputs, activation, clamp, curr, nxt, out):
+    """Whole feedforward of every row in one loop nest, compiled by numba when it is available
+
+    Every input row is normalized into curr, the inputs are left as they are; curr and nxt are work
+    vectors at least as long as the widest layer.
+    """
+    weight_offset = 0
+    bias_start = 0
+    for layer in range(layout.shape[0]):
+        bias_start += layout[layer, 0] * layout[layer, 1]
+
+    for i in range(inputs.shape[0]):
+        row = rows[i]
+        fan = inputs.shape[1]
+        norm = 0.0
+        for k in range(fan):
+            norm += inputs[i, k] * inputs[i, k]
+        norm = math.sqrt(norm)
+        for k in range(fan):
+            curr[k] = inputs[i, k] / norm if norm != 0 else inputs[i, k]
+
+        weight_offset = 0
+        bias_offset = bias_start
+        for layer in range(layout.shape[0]):
+            fan_in = layout[layer, 0]
+            fan_out = layout[layer, 1]
+            for o in range(fan_out):
+                acc = 0.0
+                for k in range(fan_in):
+                    acc += curr[k] * params[row, weight_offset + k * fan_out + o]
+                acc += params[row, bias_offset + o]
+                if activation == 0:
+                    acc = max(acc, 0.0)
+                elif activation == 2:
+                    acc = math.tanh(acc)
+                elif activation == 3:
+                    acc = 1.0 / (1.0 + math.exp(-acc))
+                nxt[o] = acc
+            for o in range(fan_out):
+                curr[o] = nxt[o]
+            weight_offset += fan_in * fan_out
+            bias_offset += fan_out
+            fan = fan_out
+
+        total = 0.0
+        for o in range(fan):
+            total += curr[o]
+        if total > clamp:
+            for o in range(fan):
+                curr[o] /= total
+        peak = curr[0]
+        for o in range(1, fan):
+            peak = max(peak, curr[o])
+        total = 0.0
+        for o in range(fan):
+            curr[o] = math.exp(curr[o] - peak)
+            total += curr[o]
+        for o in range(fan):
+            out[i, o] = curr[o] / total
+
+@functools.lru_cache(maxsize=None)
+def load_numba():
+    """Return the numba module, or None when it isn't installed, importing it on first use"""
+    try:
+        import numba
+    except ImportError:
+        return None
+    return numba
+
+@functools.lru_cache(maxsize=None)
+def fused_kernel():
+    """Return fused_forward compiled by numba when it is available, compiling it on first use"""
+    numba = load_numba()
+    return numba.njit(cache=True)(fused_forward) if numba is not None else fused_forward
+
+@functools.lru_cache(maxsize=None)
+def inference_config(activation:str="relu", dtype:str="float64", backend:str="numpy") -> InferenceConfig:
+    """Return the (shared) InferenceConfig for the given settings"""
+    return InferenceConfig(activation, dtype, backend)
+
+DEFAULT_CONFIG = inference_config()
@@ -0,0 +1,127 @@
+import json
+import logging
+import time
+
+import numpy as np
+
+# diagnostics that used to be printed every tick (vision, decisions) go here at DEBUG level
+logger = logging.getLogger("smallworld")
+
+class PhaseTimer:
+    """Collects the duration of every pass through a named phase, used as a context manager"""
+    __slots__ = ("samples", "start")
+
+    def __init__(self):
+        self.samples = []
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.samples.append(time.perf_counter() - self.start)
+
+class NullTimer:
+    """Stand-in for PhaseTimer while profiling is off, so disabled timers cost one attribute check"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+NULL_TIMER = NullTimer()
+
+class Profiler:
+    """Named timers and counters around the phases of the simulation loop.
+
+    Phases are timed with `with profiler.phase("sense"): ...` and counters bumped with
+    profiler.count(name, n). Nothing is recorded while enabled is False, which can be flipped at
+    any time. end_generation turns everything recorded since the last call into one record
+    (calls, total, mean and p95 per phase plus the counters), hands it to the callback, appends it
+    to the log file as a JSON line and starts over.
+
+    Attributes:
+        enabled: whether timers and counters record anything
+        callback: called with every generation record
+        log_path: JSON lines file every generation record is appended to
+        timers: PhaseTimer per phase name
+        counters: running total per counter name
+    """
+    def __init__(self, enabled:bool=False, callback=None, log_path:str=None):
+        self.enabled = enabled
+        self.callback = callback
+        self.log_path = log_path
+        self.log_file = None
+        self.timers = {}
+        self.counters = {}
+
+    def phase(self, name:str):
+        """Return a context manager that times one pass through the named phase"""
+        if not self.enabled:
+            return NULL_TIMER
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = PhaseTimer()
+        return timer
+
+    def count(self, name:str, n:int=1) -> None:
+        """Add n to the named counter"""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def toggle(self) -> bool:
+        """Flip profiling on or off and return the new setting"""
+        self.enabled = not self.enabled
+        return self.enabled
+
+    def end_generation(self, generation:int, **extra) -> dict:
+        """Aggregate and emit everything recorded during a generation, then reset
+
+        Keyword arguments:
+        generation -- the generation the record belongs to
+        extra -- additional fields for the record, e.g. alive=<number of agents alive>
+        """
+        if not self.enabled:
+            return None
+
+        # snapshot, the UI thread may add its render timer while this runs
+        timers = list(self.timers.items())
+        phases = {}
+        for name, timer in timers:
+            samples = np.asarray(timer.samples)
+            if not len(samples):
+                continue
+            phases[name] = {
+                "calls": len(samples),
+                "total": float(samples.sum()),
+                "mean": float(samples.mean()),
+                "p95": float(np.percentile(samples, 95)),
+            }
+        record = {"generation": generation, **extra, "phases": phases, "counters": dict(self.counters)}
+
+        for _, timer in timers:
+            timer.samples.clear()
+        self.counters.clear()
+
+        if self.callback is not None:
+            self.callback(record)
+        if self.log_path is not None:
+            if self.log_file is None:
+                self.log_file = open(self.log_path, "a")
+            self.log_file.write(json.dumps(record) + "\n")
+            self.log_file.flush()
+        return record
+
+    def close(self) -> None:
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
+def format_record(record:dict) -> str:
+    """One line summary of a generation record, mean and p95 per phase in milliseconds"""
+    phases = ", ".join(f"{name} {p['mean'] * 1000:.2f}/{p['p95'] * 1000:.2f}ms" for name, p in record["phases"].items())
+    extra = " ".join(f"{k} {v}" for k, v in record.items() if k not in ("generation", "phases", "counters"))
+    return f"Generation {record['generation']} {extra}: {phases}"
@@ -1,58 +1,78 @@
+import argparse
 import pygame
-import numpy as np
 import sys
 
-from arena import Arena
+from config import RunConfig
 from game_ui import GameUI
+from instrumentation import format_record
+from recorder import Trajectory
+from seeding import make_rng
+from simulation import SimulationThread
 
 SCREEN_WIDTH = 700 
 SCREEN_HEIGHT = 700 
-STARTING_POP = 30
+SEED = None # set to an int to replay the exact same run
+CONFIG = RunConfig(seed=SEED) # population size, selection, brains and ticks per generation, see config.RunConfig
+TICK_RATE = None # ticks per second, None runs the simulation as fast as possible
+RENDER_EVERY = 1 # draw every Nth tick
 
-rng = np.random.default_rng()
+rng = make_rng(SEED)
 
 def main():
-    ui = GameUI(Arena(1000, 1000, 450, 50, 50, 50, rng=rng), SCREEN_WIDTH, SCREEN_HEIGHT)
-    screen = ui.screen
+    parser = argparse.ArgumentParser(description="Evolve agents in a window")
+    parser.add_argument("--replay", default=None, help="play back a trajectory recorded with headless.py --record instead")
+    parser.add_argument("--generation", type=int, default=None, help="recorded generation to start the replay at")
+    args = parser.parse_args()
+
+    ui = GameUI(CONFIG.build_arena(populate=not args.replay, rng=rng), SCREEN_WIDTH, SCREEN_HEIGHT)
     arena = ui.arena
-    mode = False # True = automatic, False = manual
-    steps = 0
-    gen = 1
-    highest = 0
-    current = 0
+    if args.replay:
+        ui.replay(Trajectory(args.replay), args.generation)
+        pygame.quit()
+        return
 
     pygame.display.set_caption("Pygame Test")
-    for _ in range(0, STARTING_POP):
-        arena.add_agent()
+    # press p to toggle printing per phase timings every generation
+    arena.profiler.callback = lambda record: print(format_record(record))
+    profiler = arena.profiler
 
-    while True:
-        if steps == 200:
-            gen += 1
-            ui.update_stats(generation=gen, highest=highest, current=current)
-            # text_surface = my_font.render(f"Generation {gen}", False, (0, 0, 0))
-            steps = 0
-            arena.fitness()
-            highest = max(len(arena.finished_agents), highest)
-            ui.update_stats(generation=gen, highest=highest, current=current)
-            # highest_text = my_font.render(f"Highest: {highest}", False, (0, 0, 0))
-            arena.select()
-            arena.reset(random=True)
-            ui.erase_old_agents(screen)
+    def move_goal(arena, tick):
+        if tick % 100 == 0:
+            arena.change_goal(rng.integers(0, SCREEN_WIDTH-100), rng.integers(0, SCREEN_HEIGHT-100), rng.integers(10, 100), rng.integers(10, 100))
 
+    # the simulation runs in its own thread, the window only draws its latest snapshot
+    sim = SimulationThread(arena, steps=CONFIG.steps, tick_rate=TICK_RATE, render_every=RENDER_EVERY, on_tick=move_goal)
+    sim.start()
+    clock = pygame.time.Clock()
+    shown = None
+
+    while True:
         for event in pygame.event.get():
             if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key in [pygame.K_ESCAPE, pygame.K_q]):
+                sim.stop()
                 pygame.quit()
                 sys.exit()
             elif event.type == pygame.KEYDOWN:
+                # m toggles between automatic (the thread runs freely) and manual mode (space steps once)
                 if event.key == pygame.K_m:
-                    mode = not mode
-                if (not mode and event.key == pygame.K_SPACE):
-                    if steps % 100 == 0:
-                        arena.change_goal(rng.integers(0, screen.get_width()-100), rng.integers(0, screen.get_height()-100), rng.integers(10, 100), rng.integers(10, 100)) 
-                        ui.draw(screen)
-                    arena.agents[0].check_distance(arena.agents[0].direction)
-                    arena.update_agents()
-                    steps += 1
+                    sim.toggle()
+                if event.key == pygame.K_p:
+                    profiler.toggle()
+                if (not sim.running.is_set() and event.key == pygame.K_SPACE):
+                    sim.step()
+                    sim.publish()
+
+                # + / - change the tick rate, [ / ] draw more / fewer snapshots, g switches between skipping ticks and generations
+                if event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                    print(f"Tick rate: {sim.faster() or 'unlimited'}")
+                if event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    print(f"Tick rate: {sim.slower() or 'unlimited'}")
+                if event.key == pygame.K_LEFTBRACKET:
+                    print(f"Drawing every {sim.skip_less()} {sim.render_unit}(s)")
+                if event.key == pygame.K_RIGHTBRACKET:
+                    print(f"Drawing every {sim.skip_more()} {sim.render_unit}(s)")
+                if event.key == pygame.K_g:
+                    print(f"Drawing every {sim.render_every} {sim.toggle_render_unit()}(s)")
 
                 # moving top down camera
                 if event.key == pygame.K_LEFT:
@@ -64,21 +84,14 @@ def main():
                 if event.key == pygame.K_DOWN:
                     ui.move_camera(0, 20)
 
-
-        if mode:
-            if steps % 100 == 0:
-                arena.change_goal(rng.integers(0, SCREEN_WIDTH-100), rng.integers(0, SCREEN_HEIGHT-100), rng.integers(10, 100), rng.integers(10, 100)) 
-                ui.draw(screen)
-            arena.update_agents()
-            steps += 1
-
-        screen.fill((0, 0, 0))
-        ui.draw(screen)
-        ui.draw_agents(screen, arena.agents)
-        current = len(arena.finished_agents)
-        ui.update_stats(generation=gen, highest=highest, current=current)
-        pygame.display.flip()
-        pygame.time.Clock().tick(40)
+        # only draw when there is something new to show, so the ui leaves the cpu to the simulation
+        snapshot = sim.snapshot
+        if snapshot is not shown or ui.scene_key() != ui.background_key:
+            with profiler.phase("render"):
+                ui.render_frame(generation=snapshot["generation"] + 1, highest=snapshot["highest"],
+                                current=snapshot["finished"], state=snapshot["state"])
+            shown = snapshot
+        clock.tick(40)
 
 if __name__ == '__main__':
     main()
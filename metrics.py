@@ -0,0 +1,108 @@
+import csv
+import io
+import json
+
+import numpy as np
+
+"""
+Notes:
+    - One flat record per generation, computed from the state arrays right before selection
+    replaces the agents, so the same columns work for JSON lines and CSV.
+    - Records are buffered as already formatted lines and written out every buffer_size records, and
+    nothing is kept after that, so a run of any length uses the same memory. every=N only writes
+    every Nth generation (and skips computing the others) for very long runs.
+"""
+
+FIELDS = (
+    "generation", "agents", "alive", "finished",
+    "fitness_min", "fitness_p25", "fitness_median", "fitness_p75", "fitness_max", "fitness_mean", "fitness_std",
+    "mean_distance", "seconds",
+)
+FORMATS = ("jsonl", "csv")
+BUFFER_SIZE = 100
+
+def generation_record(arena, seconds:float) -> dict:
+    """Summarize the scored agents of an arena, see FIELDS
+
+    Fitness and distance statistics only cover the agents still alive, like the headless records.
+    mean_distance is None when the scores came without distances (see Arena.assign_fitness).
+
+    Keyword arguments:
+    arena -- the arena, after fitness has been assigned and before select
+    seconds -- how long the generation took
+    """
+    state = arena.state
+    alive = state.alive
+    scores = state.fitness[alive]
+    record = {"generation": arena.generation, "agents": len(state), "alive": int(alive.sum()),
+              "finished": int(state.finished.sum())}
+    if len(scores):
+        p25, median, p75 = np.percentile(scores, (25, 50, 75))
+        distance = arena.goal_distance
+        record.update(fitness_min=float(scores.min()), fitness_p25=float(p25), fitness_median=float(median),
+                      fitness_p75=float(p75), fitness_max=float(scores.max()), fitness_mean=float(scores.mean()),
+                      fitness_std=float(scores.std()), mean_distance=None if distance is None else float(distance[alive].mean()))
+    else:
+        record.update(dict.fromkeys(FIELDS[4:-1]))
+    record["seconds"] = seconds
+    return record
+
+class MetricsWriter:
+    """Appends generation records to a JSON lines or CSV file with buffered writes.
+
+    Attributes:
+        path: file the records are appended to
+        fmt: "jsonl" or "csv", guessed from the extension of path by default
+        every: only generations that are a multiple of this are written
+        buffer_size: number of records kept in memory between writes
+        lines: formatted records waiting to be written
+    """
+    def __init__(self, path:str, fmt:str=None, every:int=1, buffer_size:int=BUFFER_SIZE):
+        if fmt is None:
+            fmt = "csv" if path.endswith(".csv") else "jsonl"
+        if fmt not in FORMATS:
+            raise ValueError(f"fmt must be one of {FORMATS}, got {fmt!r}")
+        self.path = path
+        self.fmt = fmt
+        self.every = max(every, 1)
+        self.buffer_size = buffer_size
+        self.lines = []
+        self.file = None
+
+    def due(self, generation:int) -> bool:
+        """Whether the record of a generation would be written (so it is worth computing)"""
+        return generation % self.every == 0
+
+    def write(self, record:dict) -> None:
+        """Queue a record, writing the buffer out once it is full"""
+        if not self.due(record["generation"]):
+            return
+        if self.fmt == "jsonl":
+            self.lines.append(json.dumps(record) + "\n")
+        else:
+            self.lines.append(self.csv_line([record.get(field) for field in FIELDS]))
+        if len(self.lines) >= self.buffer_size:
+            self.flush()
+
+    def csv_line(self, values:list) -> str:
+        out = io.StringIO()
+        csv.writer(out, lineterminator="\n").writerow(["" if v is None else v for v in values])
+        return out.getvalue()
+
+    def flush(self) -> None:
+        """Write every queued record to the file"""
+        if self.file is None:
+            self.file = open(self.path, "a", newline="")
+            # a new or empty csv file starts with the column names
+            if self.fmt == "csv" and self.file.tell() == 0:
+                self.file.write(self.csv_line(FIELDS))
+        self.file.writelines(self.lines)
+        self.file.flush()
+        self.lines.clear()
+
+    def close(self) -> None:
+        if self.lines:
+            self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
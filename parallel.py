@@ -0,0 +1,134 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from arena import Arena
+from population import population_from_buffer
+from seeding import make_rng
+
+class ParallelEvaluator:
+    """Scores a generation in several independent arenas spread across a process pool.
+
+    Every arena gets its own random start (as in Arena.reset(random=True)) and optionally its own
+    goal. The brains are shipped to the workers as one flat weight buffer and the fitness of each
+    agent is averaged over the arenas before Arena.select.
+
+    Attributes:
+        arenas: how many arenas every generation is evaluated in
+        workers: how many worker processes to use
+        random_goal: whether each arena also gets a random goal placement
+        executor: the process pool doing the work
+    """
+    def __init__(self, arenas:int=8, workers:int=None, random_goal:bool=False):
+        self.arenas = arenas
+        self.workers = min(workers or os.cpu_count() or 1, arenas)
+        self.random_goal = random_goal
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def scenarios(self, arena:Arena) -> list:
+        """Draw the goal, start position and seed of every arena from the main arena's generator
+
+        Each arena gets its own spawned seed sequence, so the results do not depend on how the
+        arenas are split across workers.
+        """
+        return draw_scenarios(arena, self.arenas, self.random_goal)
+
+    def evaluate(self, arena:Arena, steps:int) -> int:
+        """Run the arena's population in every scenario and assign the averaged fitness back to it
+
+        Returns the ticks the longest running scenario lasted.
+        """
+        if arena.population is None:
+            arena.build_population()
+        buffer, layout = arena.population.to_buffer()
+        scenarios = self.scenarios(arena)
+
+        futures = [
+            self.executor.submit(evaluate_scenarios, buffer, layout, arena.width, arena.height, scenarios[i::self.workers], steps,
+                                 arena.objects, arena.inference, arena.fitness_mode, arena.timestep, arena.agent_sight)
+            for i in range(self.workers)
+        ]
+        # put every worker's scenarios back in scenario order, so the reductions below add up in the
+        # same order however many workers there are
+        agents = len(arena.population)
+        fitness = np.zeros((self.arenas, agents))
+        alive = np.zeros((self.arenas, agents), dtype=bool)
+        finished = np.zeros((self.arenas, agents), dtype=bool)
+        distance = np.zeros((self.arenas, agents))
+        ticks = np.zeros(self.arenas, dtype=int)
+        for i, future in enumerate(futures):
+            (fitness[i::self.workers], alive[i::self.workers], finished[i::self.workers], distance[i::self.workers],
+             ticks[i::self.workers]) = future.result()
+        # an agent only counts as finished when it reached the goal in every arena
+        arena.assign_fitness(fitness.mean(axis=0), finished.all(axis=0), alive.any(axis=0), mean_alive(distance.T, alive.T))
+        return int(ticks.max())
+
+def mean_alive(values:np.ndarray, alive:np.ndarray) -> np.ndarray:
+    """Mean of every row of an (agents x scenarios) array over the scenarios the agent survived, 0 if none"""
+    return np.where(alive, values, 0).sum(axis=1) / np.maximum(alive.sum(axis=1), 1)
+
+def draw_scenarios(arena:Arena, count:int, random_goal:bool=False) -> list:
+    """Return count (goal, start, seed) scenarios drawn from the arena's generator
+
+    Keyword arguments:
+    arena -- the arena whose generator, size and goal the scenarios are drawn from
+    count -- how many scenarios to draw
+    random_goal -- whether every scenario also gets a random goal placement instead of the arena's
+    """
+    res = []
+    for seed in arena.spawn_seeds(count):
+        if random_goal:
+            goal = (int(arena.rng.integers(0, arena.width - 100)), int(arena.rng.integers(0, arena.height - 100)),
+                    int(arena.rng.integers(10, 100)), int(arena.rng.integers(10, 100)))
+        else:
+            goal = (arena.goal_x, arena.goal_y, arena.goal_width, arena.goal_height)
+        start = tuple(int(v) for v in arena.random_start())
+        res.append((goal, start, seed))
+    return res
+
+def evaluate_scenarios(buffer:np.ndarray, layout:list, width, height, scenarios:list, steps:int, objects=None,
+                       inference=None, fitness_mode:str="distance", timestep:float=1.0, agent_sight=None) -> tuple:
+    """Worker entry point: simulate a population in each scenario and return (fitness, alive, finished, distance, ticks) per scenario
+
+    distance is how far every agent ended up from the scenario's goal, ticks how many ticks the scenario lasted.
+
+    Agents that left the arena score 0 in that scenario.
+    """
+    population = population_from_buffer(buffer, layout, inference)
+    fitness = np.zeros((len(scenarios), len(population)))
+    alive = np.zeros((len(scenarios), len(population)), dtype=bool)
+    finished = np.zeros((len(scenarios), len(population)), dtype=bool)
+    distance = np.zeros((len(scenarios), len(population)))
+    ticks = np.zeros(len(scenarios), dtype=int)
+    for k, (goal, start, seed) in enumerate(scenarios):
+        arena = Arena(width, height, *goal, rng=make_rng(seed))
+        if objects is not None:
+            arena.objects = objects
+        if inference is not None:
+            arena.inference = inference
+        arena.fitness_mode = fitness_mode
+        arena.timestep = timestep
+        arena.agent_sight = agent_sight
+        arena.load_population(population)
+        arena.state.x[:], arena.state.y[:], arena.state.direction[:] = start
+        for _ in range(steps):
+            arena.update_agents()
+            if not arena.state.active.any():
+                break
+        arena.fitness()
+        fitness[k] = np.where(arena.state.alive, arena.state.fitness, 0)
+        alive[k] = arena.state.alive
+        finished[k] = arena.state.finished
+        distance[k] = arena.goal_distance
+        ticks[k] = arena.ticks
+    return fitness, alive, finished, distance, ticks
@@ -0,0 +1,283 @@
+import numpy as np
+
+from brain import MAX_HIDDEN_LAYERS, MAX_NODES, Brain
+from inference import DEFAULT_CONFIG, InferenceConfig, inference_config
+
+class Population:
+    """Stacked parameters for every brain in an arena so they can be run in one batch.
+
+    Every agent's parameters are one row of params (all its weights, layer by layer, followed by
+    all its biases), weights and biases are per layer views into that matrix.
+
+    Attributes:
+        params: (agents x parameters) array holding every parameter of every brain
+        layout: (inputs, outputs) of every layer
+        weights: one (agents x in x out) view of params per layer
+        biases: one (agents x out) view of params per layer
+        config: the InferenceConfig feedforward runs with
+        scratch: buffers feedforward reuses for its intermediate results
+    """
+    def __init__(self, params:np.ndarray, layout:list, config:InferenceConfig=None):
+        self.config = DEFAULT_CONFIG if config is None else config
+        self.scratch = None
+        self.params = params
+        self.layout = [tuple(layer) for layer in layout]
+        self.weights = []
+        self.biases = []
+        count = len(params)
+        offset = 0
+        for inputs, outputs in self.layout:
+            self.weights.append(params[:, offset:offset + inputs * outputs].reshape(count, inputs, outputs))
+            offset += inputs * outputs
+        for _, outputs in self.layout:
+            self.biases.append(params[:, offset:offset + outputs])
+            offset += outputs
+
+    @classmethod
+    def from_brains(cls, brains:list, config:InferenceConfig=None):
+        """Stack the parameters of the given brains and turn each brain into a view of the stack
+
+        Keyword arguments:
+        brains -- the brains to stack, they must all share the same architecture
+        config -- the InferenceConfig of the population, the stack is stored in its precision (default DEFAULT_CONFIG)
+        """
+        config = DEFAULT_CONFIG if config is None else config
+        layout = [w.shape for w in brains[0].weights] if brains else []
+        params = np.stack([np.concatenate([w.ravel() for w in brain.weights] + [b.ravel() for b in brain.biases])
+                           for brain in brains]).astype(config.dtype, copy=False) if brains else np.zeros((0, 0), dtype=config.dtype)
+        population = cls(params, layout, config)
+
+        # rebind every brain to its row so in place mutation writes into the stack
+        for i, brain in enumerate(brains):
+            brain.weights = [w[i] for w in population.weights]
+            brain.biases = [b[i] for b in population.biases]
+            brain.config = config
+            brain.shared = False
+
+        return population
+
+    @classmethod
+    def from_buffer(cls, buffer:np.ndarray, layout:list, config:InferenceConfig=None):
+        """Rebuild a population from a buffer made by to_buffer, the arrays are views of the buffer
+
+        Keyword arguments:
+        buffer -- flat array holding every parameter of the first brain, then the second, etc.
+        layout -- (inputs, outputs) of every layer, as returned by to_buffer
+        config -- the InferenceConfig of the population (default DEFAULT_CONFIG)
+        """
+        per_agent = sum(inputs * outputs + outputs for inputs, outputs in layout)
+        return cls(buffer.reshape(-1, per_agent), layout, config)
+
+    def to_buffer(self) -> tuple:
+        """Return every parameter packed into one flat array along with the layout needed to unpack it"""
+        return self.params.ravel(), self.layout
+
+    def __len__(self):
+        return len(self.params)
+
+    def brain(self, row:int) -> Brain:
+        """Return a brain whose weights and biases are views into the given row"""
+        return Brain([], [w[row] for w in self.weights], [b[row] for b in self.biases], config=self.config)
+
+    def reproduce(self, parents_1, parents_2, mutation_rate:float, rng) -> "Population":
+        """Return a population of children, the batched version of Brain.crossover followed by Brain.mutate
+
+        Child i takes every parameter from parents_1[i] or parents_2[i] with equal probability, then
+        each parameter gets gaussian noise (standard deviation 0.1) with probability mutation_rate.
+
+        Keyword arguments:
+        parents_1 -- row of the first parent of every child
+        parents_2 -- row of the second parent of every child
+        mutation_rate -- the probability of a parameter being mutated
+        rng -- the generator to draw crossover masks and mutations from
+        """
+        shape = (len(parents_1), self.params.shape[1])
+        params = np.where(rng.random(shape) < 0.5, self.params[parents_1], self.params[parents_2])
+        mutated = rng.random(shape) <= mutation_rate
+        params += rng.normal(scale=0.1, size=shape) * mutated
+        return Population(params, self.layout, self.config)
+
+    def feedforward(self, inputs, rows=None, activation=None) -> np.ndarray:
+        """Feed one input vector per agent through its brain and return the softmax decisions
+
+        Mirrors Brain.feedforward but runs every agent with a single batched matmul per layer, or
+        with the fused kernel when config.backend is "numba". The decisions live in a scratch
+        buffer that the next call overwrites, copy them to keep them.
+
+        Inputs of shape (agents x scenarios x 11) run every brain on one input per scenario and
+        return (agents x scenarios x 3) decisions, each brain's weights are applied to all its
+        scenarios in one matmul instead of being copied per scenario.
+
+        Keyword arguments:
+        inputs -- (agents x 11) array of inputs, one row per agent, or (agents x scenarios x 11)
+        rows -- the rows of the population that the inputs belong to (default all of them)
+        activation -- the activation function to use (default the one in config)
+        """
+        inputs = np.asarray(inputs)
+        if inputs.ndim == 3:
+            agents, scenarios, _ = inputs.shape
+            if self.config.backend == "numba":
+                # the fused kernel looks up the parameters of every input row itself
+                rows = np.arange(agents) if rows is None else np.asarray(rows)
+                rows = np.repeat(rows, scenarios)
+            decisions = self.feedforward(inputs.reshape(agents * scenarios, -1), rows, activation)
+            return decisions.reshape(agents, scenarios, -1)
+
+        config = self.config
+        if activation is not None and activation != config.activation:
+            config = inference_config(activation, str(config.dtype), config.backend)
+        # buffers are sized for the whole population so that they fit however many agents are still active
+        count = max(len(self), len(inputs))
+
+        if config.backend == "numba":
+            widest = max(max(layer) for layer in self.layout)
+            self.scratch = config.scratch(count, [inputs.shape[1], widest, widest, self.layout[-1][1]], self.scratch)
+            rows = np.arange(len(inputs)) if rows is None else np.asarray(rows)
+            return config.fused(self.params, np.asarray(self.layout), rows, inputs, self.scratch)
+
+        weights, biases = self.weights, self.biases
+        if rows is not None:
+            weights = [w[rows] for w in weights]
+            biases = [b[rows] for b in biases]
+        self.scratch = config.scratch(count, [inputs.shape[1]] + [outputs for _, outputs in self.layout], self.scratch)
+        return config.forward(weights, biases, inputs, self.scratch)
+
+class MixedPopulation:
+    """Brains of several architectures, stored as one Population per architecture.
+
+    Row i of a mixed population is brain i, wherever it is stored, so it can stand in for a
+    Population: feedforward runs one batch per architecture and scatters the decisions back.
+
+    Attributes:
+        groups: one Population per architecture
+        members: for every group, the rows of the mixed population stored in it
+        group_of: group of every row
+        index_of: position of every row within its group
+        config: the InferenceConfig every group runs with
+    """
+    def __init__(self, groups:list, members:list, config:InferenceConfig=None):
+        self.config = DEFAULT_CONFIG if config is None else config
+        self.groups = groups
+        self.members = [np.asarray(rows, dtype=int) for rows in members]
+        count = sum(len(rows) for rows in self.members)
+        self.group_of = np.empty(count, dtype=int)
+        self.index_of = np.empty(count, dtype=int)
+        for g, rows in enumerate(self.members):
+            self.group_of[rows] = g
+            self.index_of[rows] = np.arange(len(rows))
+
+    @classmethod
+    def from_brains(cls, brains:list, config:InferenceConfig=None):
+        """Group the brains by architecture and stack every group, see Population.from_brains"""
+        shapes = {}
+        for i, brain in enumerate(brains):
+            shapes.setdefault(tuple(w.shape for w in brain.weights), []).append(i)
+        members = list(shapes.values())
+        groups = [Population.from_brains([brains[i] for i in rows], config) for rows in members]
+        return cls(groups, members, config)
+
+    @classmethod
+    def from_buffer(cls, buffer:np.ndarray, layout:list, config:InferenceConfig=None):
+        """Rebuild a mixed population from a buffer and layout made by to_buffer"""
+        groups = []
+        offset = 0
+        for group in layout:
+            per_agent = sum(inputs * outputs + outputs for inputs, outputs in group["layout"])
+            size = per_agent * len(group["rows"])
+            groups.append(Population.from_buffer(buffer[offset:offset + size], group["layout"], config))
+            offset += size
+        return cls(groups, [group["rows"] for group in layout], config)
+
+    def to_buffer(self) -> tuple:
+        """Return every parameter packed into one flat array along with the layout and rows of every group"""
+        buffer = np.concatenate([group.params.ravel() for group in self.groups]) if self.groups else np.zeros(0)
+        layout = [{"layout": [list(layer) for layer in group.layout], "rows": rows.tolist()}
+                  for group, rows in zip(self.groups, self.members)]
+        return buffer, layout
+
+    def __len__(self):
+        return len(self.group_of)
+
+    def brain(self, row:int) -> Brain:
+        return self.groups[self.group_of[row]].brain(self.index_of[row])
+
+    def reproduce(self, parents_1, parents_2, mutation_rate:float, rng) -> "MixedPopulation":
+        """Return the children of the given parents, see Population.reproduce
+
+        Parents of the same architecture are crossed in one batch per architecture, the others one
+        pair at a time with Brain.crossover (the child takes the first parent's architecture).
+        """
+        parents_1 = np.asarray(parents_1, dtype=int)
+        parents_2 = np.asarray(parents_2, dtype=int)
+        children = [None] * len(parents_1)
+        same = self.group_of[parents_1] == self.group_of[parents_2]
+        for g, group in enumerate(self.groups):
+            pairs = np.flatnonzero(same & (self.group_of[parents_1] == g))
+            if len(pairs):
+                offspring = group.reproduce(self.index_of[parents_1[pairs]], self.index_of[parents_2[pairs]], mutation_rate, rng)
+                for i, child in enumerate(pairs):
+                    children[child] = offspring.brain(i)
+        for child in np.flatnonzero(~same):
+            brain = self.brain(parents_1[child]).crossover(self.brain(parents_2[child]), rng)
+            children[child] = brain.mutate(mutation_rate, rng=rng)
+        return stack_brains(children, self.config)
+
+    def feedforward(self, inputs, rows=None, activation=None) -> np.ndarray:
+        """Feed one input vector per agent through its brain and return the softmax decisions
+
+        Keyword arguments:
+        inputs -- (agents x 11) array of inputs, one row per agent, or (agents x scenarios x 11), see Population.feedforward
+        rows -- the rows of the population that the inputs belong to (default all of them)
+        activation -- the activation function to use (default the one in config)
+        """
+        inputs = np.asarray(inputs)
+        every_row = rows is None
+        rows = np.arange(len(inputs)) if every_row else np.asarray(rows)
+        groups = self.group_of[rows]
+        res = None
+        for g, group in enumerate(self.groups):
+            mine = np.flatnonzero(groups == g)
+            if not len(mine):
+                continue
+            # all of a group's rows in order need no gathering of its parameters
+            decisions = group.feedforward(inputs[mine], None if every_row else self.index_of[rows[mine]], activation)
+            if res is None:
+                res = np.empty(inputs.shape[:-1] + decisions.shape[-1:], dtype=decisions.dtype)
+            res[mine] = decisions
+        return np.empty((0, 0)) if res is None else res
+
+def stack_brains(brains:list, config:InferenceConfig=None):
+    """Return a Population of the brains, or a MixedPopulation when their architectures differ"""
+    if len({tuple(w.shape for w in brain.weights) for brain in brains}) > 1:
+        return MixedPopulation.from_brains(brains, config)
+    return Population.from_brains(brains, config)
+
+def population_from_buffer(buffer:np.ndarray, layout:list, config:InferenceConfig=None):
+    """Rebuild whichever population to_buffer was called on"""
+    if layout and isinstance(layout[0], dict):
+        return MixedPopulation.from_buffer(buffer, layout, config)
+    return Population.from_buffer(buffer, layout, config)
+
+def mutate_topology(population, rate:float, rng, max_nodes:int=MAX_NODES, max_layers:int=MAX_HIDDEN_LAYERS):
+    """Return the population with a random structural mutation applied to each brain with probability rate
+
+    Keyword arguments:
+    population -- Population or MixedPopulation of children
+    rate -- probability of each brain getting one structural mutation, see Brain.mutate_structure
+    rng -- the generator to draw the mutations from
+    max_nodes -- most nodes a hidden layer may grow to
+    max_layers -- most hidden layers a brain may grow to
+    """
+    chosen = np.flatnonzero(rng.random(len(population)) < rate)
+    if not len(chosen):
+        return population
+    brains = [population.brain(i) for i in range(len(population))]
+    for i in chosen:
+        brains[i].mutate_structure(rng, max_nodes, max_layers)
+    return stack_brains(brains, population.config)
+
+def sample_choices(decisions:np.ndarray, rng) -> np.ndarray:
+    """Draw one action per row of decisions, equivalent to rng.choice([0, 1, 2], p=row) for each row"""
+    cumulative = np.cumsum(decisions, axis=1)
+    draws = rng.random(len(decisions))
+    return (draws[:, None] >= cumulative[:, :-1]).sum(axis=1)
@@ -0,0 +1,201 @@
+import numpy as np
+
+from checkpoint import align
+from world import WorldState
+
+"""
+Notes:
+    - A trajectory file is an 8 byte magic string followed by one block per recorded generation.
+    A block is a 64 byte header (generation, ticks, agents, encoding), for the delta encoding the
+    agents' first positions as float32, then one fixed size frame per tick: x, y, direction,
+    status (bit 0 alive, bit 1 finished) of every agent and the goal rectangle.
+    - Frames are collected in a preallocated ring buffer of capacity ticks and appended to the file
+    whenever it fills up, so recording costs one array copy per tick and constant memory.
+    - Positions are stored as float32, float16 (half the size, about 0.5 units off at the far side
+    of a 1000 wide arena) or float16 deltas from the previous tick (same size, exact to a few
+    hundredths because a tick only moves an agent by its speed).
+    - Trajectory maps the frames of a block straight out of the file, so scrubbing through a long
+    recording only reads the ticks that are looked at.
+"""
+
+MAGIC = b"SMWTRAJ1"
+ENCODINGS = ("float32", "float16", "delta")
+CAPACITY = 256
+HEADER_SIZE = 64
+BLOCK_HEADER = np.dtype([("generation", "<i8"), ("ticks", "<i8"), ("agents", "<i8"), ("encoding", "<i8")])
+ALIVE = 1
+FINISHED = 2
+
+def frame_dtype(agents:int, encoding:str) -> np.dtype:
+    """Layout of one recorded tick of agents agents"""
+    position = "<f4" if encoding == "float32" else "<f2"
+    return np.dtype([
+        ("x", position, (agents,)),
+        ("y", position, (agents,)),
+        ("direction", "<u2", (agents,)),
+        ("status", "u1", (agents,)),
+        ("goal", "<f4", (4,)),
+    ])
+
+class Recorder:
+    """Records every tick of an arena to a trajectory file, hooked up through Arena.recorder.
+
+    Attributes:
+        path: the trajectory file
+        encoding: one of ENCODINGS, how positions are stored
+        capacity: ticks buffered in memory between writes
+        every: only generations that are a multiple of this are recorded
+        frames: the ring buffer of the generation being recorded, None between generations
+        count: frames in the ring buffer that haven't been written yet
+    """
+    def __init__(self, path:str, encoding:str="float32", capacity:int=CAPACITY, every:int=1):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"encoding must be one of {ENCODINGS}, got {encoding!r}")
+        self.path = path
+        self.encoding = encoding
+        self.capacity = capacity
+        self.every = max(every, 1)
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.frames = None
+        self.count = 0
+        self.header = None
+        self.block_start = 0
+        self.last_x = None
+        self.last_y = None
+
+    def record(self, arena) -> None:
+        """Append the arena's current state as the next tick of its generation"""
+        if arena.generation % self.every:
+            return
+        state = arena.state
+        if self.frames is None or self.header["agents"] != len(state) or self.header["generation"] != arena.generation:
+            self.end_generation()
+            self.begin(arena.generation, state)
+
+        frame = self.frames[self.count]
+        if self.encoding == "delta":
+            # deltas from the positions as the reader will rebuild them, so rounding never piles up
+            frame["x"] = state.x - self.last_x
+            frame["y"] = state.y - self.last_y
+            self.last_x += frame["x"]
+            self.last_y += frame["y"]
+        else:
+            frame["x"] = state.x
+            frame["y"] = state.y
+        frame["direction"] = state.direction
+        frame["status"] = state.alive * ALIVE + state.finished * FINISHED
+        frame["goal"] = (arena.goal_x, arena.goal_y, arena.goal_width, arena.goal_height)
+        self.count += 1
+        self.header["ticks"] += 1
+        if self.count == self.capacity:
+            self.flush()
+
+    def begin(self, generation:int, state) -> None:
+        agents = len(state)
+        self.header = np.zeros((), dtype=BLOCK_HEADER)
+        self.header["generation"] = generation
+        self.header["agents"] = agents
+        self.header["encoding"] = ENCODINGS.index(self.encoding)
+        self.block_start = self.file.tell()
+        self.file.write(bytes(HEADER_SIZE))
+        if self.encoding == "delta":
+            # the first frame then holds zero deltas from these
+            self.last_x = state.x.astype(np.float32)
+            self.last_y = state.y.astype(np.float32)
+            origin = np.concatenate([self.last_x, self.last_y])
+            self.file.write(origin.tobytes() + bytes(align(origin.nbytes) - origin.nbytes))
+        self.frames = np.zeros(self.capacity, dtype=frame_dtype(agents, self.encoding))
+        self.count = 0
+
+    def flush(self) -> None:
+        """Write the buffered frames to the file"""
+        if self.count:
+            self.file.write(self.frames[:self.count].tobytes())
+            self.count = 0
+
+    def end_generation(self) -> None:
+        """Write out the generation being recorded and fill in its header"""
+        if self.frames is None:
+            return
+        self.flush()
+        end = self.file.tell()
+        self.file.seek(self.block_start)
+        self.file.write(self.header.tobytes())
+        self.file.seek(end)
+        self.file.flush()
+        self.frames = None
+
+    def close(self) -> None:
+        self.end_generation()
+        self.file.close()
+
+class Trajectory:
+    """Reads a trajectory file written by Recorder.
+
+    Attributes:
+        path: the trajectory file
+        blocks: generation -> (offset of its first frame, ticks, agents, encoding, offset of the delta origin)
+    """
+    def __init__(self, path:str):
+        self.path = path
+        self.blocks = {}
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a smallworld trajectory")
+            while True:
+                start = f.tell()
+                raw = f.read(HEADER_SIZE)
+                if len(raw) < HEADER_SIZE:
+                    break
+                header = np.frombuffer(raw[:BLOCK_HEADER.itemsize], dtype=BLOCK_HEADER)[0]
+                ticks, agents = int(header["ticks"]), int(header["agents"])
+                encoding = ENCODINGS[int(header["encoding"])]
+                origin = start + HEADER_SIZE
+                frames = origin + (align(8 * agents) if encoding == "delta" else 0)
+                self.blocks[int(header["generation"])] = (frames, ticks, agents, encoding, origin)
+                f.seek(frames + ticks * frame_dtype(agents, encoding).itemsize)
+
+    @property
+    def generations(self) -> list:
+        return sorted(self.blocks)
+
+    def load(self, generation:int) -> dict:
+        """Return the recorded ticks of a generation as (ticks x agents) arrays
+
+        The dict holds x, y, direction, alive, finished and goal ((ticks x 4) x, y, width, height).
+        """
+        frames_at, ticks, agents, encoding, origin_at = self.blocks[generation]
+        if not ticks:
+            frames = np.zeros(0, dtype=frame_dtype(agents, encoding))
+        else:
+            frames = np.memmap(self.path, dtype=frame_dtype(agents, encoding), mode="r", offset=frames_at, shape=(ticks,))
+
+        if encoding == "delta":
+            origin = np.fromfile(self.path, dtype="<f4", count=2 * agents, offset=origin_at)
+            # add the deltas up in the same order the recorder did
+            x = np.cumsum(np.concatenate([origin[None, :agents], frames["x"].astype(np.float32)]), axis=0, dtype=np.float32)[1:]
+            y = np.cumsum(np.concatenate([origin[None, agents:], frames["y"].astype(np.float32)]), axis=0, dtype=np.float32)[1:]
+        else:
+            x, y = frames["x"], frames["y"]
+        status = frames["status"]
+        return {
+            "x": x,
+            "y": y,
+            "direction": frames["direction"],
+            "alive": (status & ALIVE) > 0,
+            "finished": (status & FINISHED) > 0,
+            "goal": frames["goal"],
+        }
+
+def frame_state(recording:dict, tick:int, state:WorldState=None) -> WorldState:
+    """Fill a WorldState (a new one unless state is given) with one tick of a recording from Trajectory.load"""
+    agents = recording["x"].shape[1]
+    if state is None or len(state) != agents:
+        state = WorldState(agents)
+    state.x[:] = recording["x"][tick]
+    state.y[:] = recording["y"][tick]
+    state.direction[:] = recording["direction"][tick]
+    state.alive[:] = recording["alive"][tick]
+    state.finished[:] = recording["finished"][tick]
+    return state
@@ -0,0 +1,103 @@
+import numpy as np
+
+from arena import Arena
+from parallel import draw_scenarios, mean_alive
+from seeding import make_rng
+from world import WorldState
+
+"""
+Notes:
+    - ScenarioEvaluator runs every brain in K scenarios (start position, heading and optionally goal)
+    at the same time in one process. The agents x scenarios grid is flattened into the rows of a
+    single WorldState, agent i's scenario k being row i * K + k, and the goal becomes one array entry
+    per row, so a tick is the usual Arena.update_agents on K times as many rows, with Arena.scenarios
+    telling it that row r is driven by brain r // K.
+    - While every row is active inference keeps the scenario axis: each brain's weights are applied
+    to its (K x inputs) block in one matmul (see Population.feedforward), so nothing is copied per
+    scenario. Once some rows are done only the brains of the active rows run, like in a single arena.
+    - The scores of a brain across its scenarios are aggregated like ParallelEvaluator does, agents
+    that left the arena in a scenario score 0 in it.
+"""
+
+AGGREGATES = {
+    "mean": np.mean,
+    "median": np.median,
+    "min": np.min,
+}
+
+class ScenarioEvaluator:
+    """Scores a generation in several scenarios at once, as one (agents x scenarios) batch.
+
+    Has the same evaluate(arena, steps) interface as parallel.ParallelEvaluator, so run_generation
+    can use either.
+
+    Attributes:
+        scenarios: how many scenarios every brain is evaluated in
+        random_goal: whether each scenario also gets a random goal placement
+        aggregate: how a brain's scores across its scenarios are combined, one of AGGREGATES
+    """
+    def __init__(self, scenarios:int=8, random_goal:bool=False, aggregate:str="mean"):
+        if aggregate not in AGGREGATES:
+            raise ValueError(f"aggregate must be one of {sorted(AGGREGATES)}, got {aggregate!r}")
+        self.scenarios = scenarios
+        self.random_goal = random_goal
+        self.aggregate = aggregate
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        pass
+
+    def build(self, arena:Arena) -> Arena:
+        """Return an arena with one row per agent and scenario, drawn from the arena's generator
+
+        Its goal coordinates are arrays holding the goal of every row, and it shares the arena's
+        population, objects, agent sight, fitness mode and profiler.
+        """
+        scenarios = draw_scenarios(arena, self.scenarios, self.random_goal)
+        goals = np.array([goal for goal, _, _ in scenarios], dtype=float)
+        starts = np.array([start for _, start, _ in scenarios])
+        agents = len(arena.state)
+
+        grid = Arena(arena.width, arena.height, *np.tile(goals, (agents, 1)).T, rng=make_rng(scenarios[0][2]))
+        grid.objects = arena.objects
+        grid.fitness_mode = arena.fitness_mode
+        grid.timestep = arena.timestep
+        grid.agent_sight = arena.agent_sight
+        grid.scenarios = self.scenarios
+        grid.profiler = arena.profiler
+        grid.population = arena.population
+        grid.state = WorldState(agents * self.scenarios)
+        grid.state.x[:] = np.tile(starts[:, 0], agents)
+        grid.state.y[:] = np.tile(starts[:, 1], agents)
+        grid.state.direction[:] = np.tile(starts[:, 2], agents)
+        grid.state.speed[:] = np.repeat(arena.state.speed, self.scenarios)
+        return grid
+
+    def evaluate(self, arena:Arena, steps:int) -> int:
+        """Run the arena's population in every scenario and assign the aggregated fitness back to it
+
+        Returns the ticks the longest running scenario lasted.
+        """
+        if arena.population is None:
+            arena.build_population()
+        grid = self.build(arena)
+        for _ in range(steps):
+            grid.update_agents()
+            if not grid.state.active.any():
+                break
+        grid.fitness()
+
+        state = grid.state
+        fitness = np.where(state.alive, state.fitness, 0).reshape(-1, self.scenarios)
+        alive = state.alive.reshape(-1, self.scenarios)
+        finished = state.finished.reshape(-1, self.scenarios)
+        distance = grid.goal_distance.reshape(-1, self.scenarios)
+        # an agent only counts as finished when it reached the goal in every scenario
+        arena.assign_fitness(AGGREGATES[self.aggregate](fitness, axis=1), finished.all(axis=1), alive.any(axis=1),
+                             mean_alive(distance, alive))
+        return grid.ticks
@@ -0,0 +1,91 @@
+import numpy as np
+
+from arena import Arena
+
+"""
+Notes:
+    - Ending a generation once no agent is active doesn't change its outcome: update_agents does no
+    work and draws no random numbers when every agent has died or finished, so the arena would
+    just sit there until the step budget ran out.
+    - The step budget can grow when the best fitness stops improving, so short generations are used
+    while there is easy progress and longer ones once agents need more time to get further.
+    - Stuck detection is a heuristic and is off by default: every stuck_window ticks, agents that
+    ended up less than stuck_distance away from where they were at the start of the window (e.g.
+    circling in place) are retired like agents that died.
+"""
+
+STEPS = 200
+MAX_STEPS = 1000
+GROWTH = 1.25
+PATIENCE = 5
+TOLERANCE = 1e-3
+
+class GenerationScheduler:
+    """Decides how many ticks each generation of an arena runs.
+
+    Attributes:
+        budget: the most ticks the next generation may run
+        max_steps: the budget never grows past this
+        growth: factor the budget grows by after patience generations without progress, 1 never grows
+        patience: number of generations the best fitness may stall before the budget grows
+        tolerance: smallest rise of the best fitness that counts as progress
+        stuck_window: ticks between stuck checks, None disables them
+        stuck_distance: agents that moved less than this during a window are stuck
+        best: best fitness seen so far
+        stalled: generations since the best fitness last improved
+        ticks: ticks run in the last generation
+    """
+    def __init__(self, steps:int=STEPS, max_steps:int=MAX_STEPS, growth:float=GROWTH, patience:int=PATIENCE,
+                 tolerance:float=TOLERANCE, stuck_window:int=None, stuck_distance:float=None):
+        self.budget = steps
+        self.max_steps = max(max_steps, steps)
+        self.growth = growth
+        self.patience = patience
+        self.tolerance = tolerance
+        self.stuck_window = stuck_window
+        self.stuck_distance = stuck_distance
+        self.best = -np.inf
+        self.stalled = 0
+        self.ticks = 0
+
+    def run(self, arena:Arena) -> int:
+        """Tick the arena until the budget runs out or no agent is active and return the number of ticks"""
+        state = arena.state
+        anchor_x = state.x.copy()
+        anchor_y = state.y.copy()
+        tick = 0
+        while tick < self.budget:
+            arena.update_agents()
+            tick += 1
+            if not state.active.any():
+                break
+            if self.stuck_window and tick % self.stuck_window == 0:
+                self.retire_stuck(arena, anchor_x, anchor_y)
+                anchor_x[:] = state.x
+                anchor_y[:] = state.y
+        self.ticks = tick
+        arena.profiler.count("ticks_saved", self.budget - tick)
+        return tick
+
+    def retire_stuck(self, arena:Arena, anchor_x:np.ndarray, anchor_y:np.ndarray) -> None:
+        """Kill the active agents that are within stuck_distance of their position at the start of the window"""
+        state = arena.state
+        distance = self.stuck_distance
+        if distance is None:
+            # a full circle of 15 degree turns ends where it started, so anything well inside one step counts
+            distance = state.speed / 2
+        stuck = state.active & ((state.x - anchor_x) ** 2 + (state.y - anchor_y) ** 2 < distance ** 2)
+        state.alive[stuck] = False
+        arena.profiler.count("stuck", int(stuck.sum()))
+
+    def end_generation(self, best_fitness:float) -> int:
+        """Update the budget from the best fitness of the generation that just ended and return it"""
+        if best_fitness > self.best + self.tolerance:
+            self.best = best_fitness
+            self.stalled = 0
+        else:
+            self.stalled += 1
+            if self.stalled >= self.patience:
+                self.budget = min(int(np.ceil(self.budget * self.growth)), self.max_steps)
+                self.stalled = 0
+        return self.budget
@@ -0,0 +1,55 @@
+import numpy as np
+
+"""
+Notes:
+    - Every random draw in a run should come from one generator hierarchy rooted at a single seed:
+    the arena's generator drives agents, brains and selection, and child seed sequences are
+    spawned from it for anything that runs independently (e.g. parallel arenas).
+    - Code that is called without a generator falls back to one shared module level generator
+    instead of building a new one per call.
+"""
+
+_fallback_rng = np.random.default_rng()
+
+def make_rng(seed=None) -> np.random.Generator:
+    """Return a generator for the given seed (int, SeedSequence or None), generators are passed through"""
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+def resolve_rng(rng=None) -> np.random.Generator:
+    """Return rng, or the shared fallback generator when rng is None"""
+    return _fallback_rng if rng is None else rng
+
+def seed_sequence(rng:np.random.Generator) -> np.random.SeedSequence:
+    """Return the SeedSequence a generator was built from"""
+    bit_generator = rng.bit_generator
+    # public since numpy 1.25, older versions only have the private attribute
+    return getattr(bit_generator, "seed_seq", None) or getattr(bit_generator, "_seed_seq")
+
+def spawn_seeds(rng:np.random.Generator, count:int) -> list:
+    """Spawn count independent child SeedSequences from the seed sequence behind rng
+
+    Spawning is deterministic: the n-th call on a generator always yields the same children,
+    no matter how many draws have been made from the generator itself.
+    """
+    return seed_sequence(rng).spawn(count)
+
+def rng_state(rng:np.random.Generator) -> dict:
+    """Return everything needed to rebuild rng exactly, including its spawning position, as plain data"""
+    bit_generator = rng.bit_generator
+    seed_seq = seed_sequence(rng)
+    return {
+        "bit_generator": bit_generator.state,
+        "entropy": seed_seq.entropy,
+        "spawn_key": list(seed_seq.spawn_key),
+        "n_children_spawned": seed_seq.n_children_spawned,
+    }
+
+def restore_rng(state:dict) -> np.random.Generator:
+    """Rebuild a generator from the output of rng_state"""
+    seed_seq = np.random.SeedSequence(state["entropy"], spawn_key=state["spawn_key"],
+                                      n_children_spawned=state["n_children_spawned"])
+    bit_generator = getattr(np.random, state["bit_generator"]["bit_generator"])(seed_seq)
+    bit_generator.state = state["bit_generator"]
+    return np.random.Generator(bit_generator)
@@ -0,0 +1,100 @@
+import numpy as np
+
+"""
+Notes:
+    - Fitness shaping and selection work on plain arrays: a fitness function maps an arena's state to
+    one score per row, a selection function maps scores to row indices.
+    - Every fitness function gives finished agents a score of at least 1 and everyone else less
+    than 1 within one arena. Aggregated scores (a mean over several arenas or scenarios) don't
+    keep that, so the evaluators hand Arena.assign_fitness a finished mask of their own.
+    - truncation only partially sorts (np.partition) and then sorts the handful it keeps, so picking
+    survivors stays linear in the number of agents.
+"""
+
+def distance_fitness(arena) -> np.ndarray:
+    """1 / (1 + squared distance to the goal's corner), 1 for finished agents"""
+    state = arena.state
+    distance_squared = (state.x - arena.goal_x) ** 2 + (state.y - arena.goal_y) ** 2
+    return np.where(state.finished, 1, 1 / (1 + distance_squared))
+
+def center_fitness(arena) -> np.ndarray:
+    """1 / (1 + squared distance to the goal's center), 1 for finished agents"""
+    state = arena.state
+    center_x = arena.goal_x + arena.goal_width / 2
+    center_y = arena.goal_y + arena.goal_height / 2
+    distance_squared = (state.x - center_x) ** 2 + (state.y - center_y) ** 2
+    return np.where(state.finished, 1, 1 / (1 + distance_squared))
+
+def time_fitness(arena) -> np.ndarray:
+    """Like distance_fitness, but agents that finished sooner score higher: 1 + 1 / (1 + tick they finished on)"""
+    fitness = distance_fitness(arena)
+    for rows, tick in zip(arena.finish_order, arena.finish_ticks):
+        fitness[rows] = 1 + 1 / (1 + tick)
+    return fitness
+
+def rank_fitness(arena) -> np.ndarray:
+    """Rank of each unfinished agent's distance_fitness scaled into (0, 1), 1 for finished agents
+
+    Only the order of the agents matters, so a few agents that got very close can't crowd out the rest.
+    """
+    fitness = distance_fitness(arena)
+    unfinished = np.flatnonzero(~arena.state.finished)
+    ranks = np.empty(len(unfinished))
+    ranks[np.argsort(fitness[unfinished], kind="stable")] = np.arange(1, len(unfinished) + 1)
+    fitness[unfinished] = ranks / (len(unfinished) + 1)
+    return fitness
+
+FITNESS = {
+    "distance": distance_fitness,
+    "center": center_fitness,
+    "time": time_fitness,
+    "rank": rank_fitness,
+}
+
+def truncation(fitness:np.ndarray, count:int) -> np.ndarray:
+    """Return the indices of the count highest scores, best first, ties in index order
+
+    Same result as np.argsort(-fitness, kind="stable")[:count] without sorting everything.
+    """
+    if count >= len(fitness):
+        return np.argsort(-fitness, kind="stable")
+    if count <= 0:
+        return np.zeros(0, dtype=int)
+    kth = np.partition(fitness, len(fitness) - count)[len(fitness) - count]
+    above = np.flatnonzero(fitness > kth)
+    ties = np.flatnonzero(fitness == kth)[:count - len(above)]
+    chosen = np.concatenate([above, ties])
+    return chosen[np.argsort(-fitness[chosen], kind="stable")]
+
+def roulette(fitness:np.ndarray, size, rng) -> np.ndarray:
+    """Draw indices with probability proportional to their fitness"""
+    return rng.choice(len(fitness), size=size, p=fitness / fitness.sum())
+
+def stochastic_universal(fitness:np.ndarray, size, rng) -> np.ndarray:
+    """Draw indices proportionally to fitness with evenly spaced pointers over one spin, in random order
+
+    Every index is drawn within one of its expected number of times, unlike roulette.
+    """
+    count = int(np.prod(size))
+    cumulative = np.cumsum(fitness)
+    step = cumulative[-1] / count
+    pointers = (rng.random() + np.arange(count)) * step
+    picks = np.minimum(np.searchsorted(cumulative, pointers, side="right"), len(fitness) - 1)
+    return rng.permutation(picks).reshape(size)
+
+def tournament(fitness:np.ndarray, size, rng, rounds:int=3) -> np.ndarray:
+    """For every draw pick rounds indices uniformly and keep the fittest of them"""
+    shape = (size,) if np.isscalar(size) else tuple(size)
+    candidates = rng.integers(len(fitness), size=shape + (rounds,))
+    return np.take_along_axis(candidates, fitness[candidates].argmax(axis=-1)[..., None], axis=-1)[..., 0]
+
+def uniform(fitness:np.ndarray, size, rng) -> np.ndarray:
+    """Draw indices uniformly, fitness only matters through who got truncated into the pool"""
+    return rng.integers(len(fitness), size=size)
+
+SELECTION = {
+    "roulette": roulette,
+    "sus": stochastic_universal,
+    "tournament": tournament,
+    "truncation": uniform,
+}
@@ -0,0 +1,158 @@
+import numpy as np
+
+import angles
+
+# angles (in degrees, relative to the agent's direction) that each agent casts a ray along
+RAY_OFFSETS = np.arange(11) * 10 - 50
+# unit vectors of the default rays for every whole degree heading, (360 x rays)
+RAY_COS = angles.cos(angles.DEGREES[:, None] + RAY_OFFSETS)
+RAY_SIN = angles.sin(angles.DEGREES[:, None] + RAY_OFFSETS)
+# how far an agent can see the goal, matches the segment length used by Agent.convert_to_line
+RAY_LENGTH = 1000
+
+def cast_rays(x, y, direction, width, height, goal, offsets=RAY_OFFSETS, ray_length=RAY_LENGTH, objects=None) -> np.ndarray:
+    """Return the vision of every agent along every ray as an (agents x rays x 2) array
+
+    The last axis holds a pair in the layout of Agent.check_distance: the distance to whatever
+    the ray hits first and a flag that is 1 when that is the goal and 0 when it is the arena wall
+    (or an obstacle). The values are not the same: check_distance swaps the walls at 90 and 270
+    degrees and measures the wrong wall for headings between 180 and 270, so about one ray in
+    seven of the old per-agent vision differs, and the distances here are the corrected ones.
+
+    Keyword arguments:
+    x -- x coordinates of the agents
+    y -- y coordinates of the agents
+    direction -- directions of the agents in degrees
+    width -- width of the arena
+    height -- height of the arena
+    goal -- (x, y, width, height) of the goal rectangle, each a number or an array with one per agent
+    offsets -- ray angles in degrees relative to each agent's direction
+    ray_length -- maximum distance at which the goal can be seen
+    objects -- optional WorldObjects holding extra goals and obstacles, which block whatever is behind them
+    """
+    x = np.asarray(x, dtype=float)[:, None]
+    y = np.asarray(y, dtype=float)[:, None]
+    dx, dy = ray_directions(direction, offsets)
+
+    goal_x, goal_y, goal_width, goal_height = (np.asarray(value)[..., None] if np.ndim(value) else value for value in goal)
+    goal_near, goal_far = slab_interval(x, y, dx, dy, goal_x, goal_y, goal_x + goal_width, goal_y + goal_height)
+    goal_hit = (goal_near <= goal_far) & (goal_far >= 0) & (goal_near <= ray_length)
+    # an agent standing inside the goal sees the edge it would leave through
+    goal_distance = np.where(goal_near >= 0, goal_near, goal_far)
+
+    _, wall_distance = slab_interval(x, y, dx, dy, 0, 0, width, height)
+    wall_distance = np.maximum(wall_distance, 0)
+
+    res = np.empty(dx.shape + (2,))
+    res[..., 0] = np.where(goal_hit, goal_distance, wall_distance)
+    res[..., 1] = goal_hit
+
+    if objects is not None and len(objects):
+        distance, kind = objects.cast(x, y, dx, dy, ray_length)
+        closer = distance < res[..., 0]
+        res[..., 0] = np.where(closer, distance, res[..., 0])
+        res[..., 1] = np.where(closer, kind == objects.GOAL, res[..., 1])
+    return res
+
+def sweep_moves(x, y, dx, dy, length, goal, objects=None) -> np.ndarray:
+    """Return how far every agent gets along its move before it enters the goal or an object
+
+    A move whose segment runs through the goal (or an object) but ends outside of it stops inside
+    it, halfway through the part of its path inside the shape (see swept_stop), so tests of the end
+    point alone (Arena.check_goal, Arena.check_death) catch every crossing however long the moves
+    are. Every other move goes its whole length.
+
+    Moves shorter than the smallest shape can't jump across one (at most clip a corner, which the
+    end point tests miss just as they did before moves were swept), so when every move is that
+    short, as at the default timestep, nothing is swept. Otherwise only moves whose bounding box
+    overlaps the goal or an object get the exact segment test.
+
+    Keyword arguments:
+    x -- x coordinates the agents move from
+    y -- y coordinates the agents move from
+    dx -- x components of the unit direction of every move
+    dy -- y components of the unit direction of every move
+    length -- how far every agent moves
+    goal -- (x, y, width, height) of the goal rectangle, each a number or an array with one per agent
+    objects -- optional WorldObjects holding extra goals and obstacles
+
+    x, y, dx, dy and length are float arrays with one entry per agent.
+    """
+    res = np.array(length, dtype=float)
+    smallest = min(side.min() if isinstance(side, np.ndarray) else side for side in goal[2:])
+    if objects is not None:
+        smallest = min(smallest, objects.smallest)
+    if not len(res) or res.max() < smallest:
+        return res
+    # bounding box of every move, only moves whose box overlaps a shape can run into it
+    end_x = x + length * dx
+    end_y = y + length * dy
+    low_x, high_x = np.minimum(x, end_x), np.maximum(x, end_x)
+    low_y, high_y = np.minimum(y, end_y), np.maximum(y, end_y)
+
+    goal_x, goal_y, goal_width, goal_height = goal
+    near_goal = np.flatnonzero((high_x > goal_x) & (low_x < goal_x + goal_width) & (high_y > goal_y) & (low_y < goal_y + goal_height))
+    if len(near_goal):
+        goal_x, goal_y, goal_width, goal_height = (value[near_goal] if np.ndim(value) else value for value in goal)
+        step = res[near_goal]
+        near, far = slab_interval(x[near_goal], y[near_goal], dx[near_goal], dy[near_goal],
+                                  goal_x, goal_y, goal_x + goal_width, goal_y + goal_height)
+        res[near_goal] = swept_stop(near, far, step)
+
+    if objects is not None and len(objects):
+        # every (move, object) pair whose boxes overlap, each move stops in the shape it gets out of soonest
+        bounds = objects.bounds
+        moves, ids = np.nonzero((high_x[:, None] > bounds[:, 0]) & (low_x[:, None] < bounds[:, 2])
+                                & (high_y[:, None] > bounds[:, 1]) & (low_y[:, None] < bounds[:, 3]))
+        if len(moves):
+            near, far = objects.interval(ids, x[moves], y[moves], dx[moves], dy[moves])
+            np.minimum.at(res, moves, swept_stop(near, far, length[moves]))
+    return res
+
+def swept_stop(near, far, length):
+    """Return how far moves of the given length get along a shape they enter at near and leave at far
+
+    Moves that pass through the shape stop halfway through the part of their path inside it, which
+    is strictly inside it even where the path only grazes a corner or a circle. Moves that miss it
+    or end inside it go their whole length.
+    """
+    enter = np.maximum(near, 0)
+    leave = np.minimum(far, length)
+    ends_inside = (near < length) & (length < far)
+    with np.errstate(invalid="ignore"):
+        return np.where((enter < leave) & ~ends_inside, (enter + leave) / 2, length)
+
+def ray_directions(direction, offsets=RAY_OFFSETS) -> tuple:
+    """Return the x and y components of the unit vector along every ray of every agent, each (agents x rays)
+
+    Whole degree headings are looked up in precomputed tables, see angles.
+    """
+    direction = np.asarray(direction)
+    if offsets is RAY_OFFSETS and direction.dtype.kind in "iu":
+        index = direction % 360
+        return RAY_COS[index], RAY_SIN[index]
+    ray_angles = direction[:, None] + np.asarray(offsets)[None, :]
+    return angles.cos(ray_angles), angles.sin(ray_angles)
+
+def slab_interval(x, y, dx, dy, x_min, y_min, x_max, y_max):
+    """Return the distances along each ray at which it enters and leaves an axis aligned box
+
+    The ray misses the box when the entry distance is greater than the exit distance.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tx1 = (x_min - x) / dx
+        tx2 = (x_max - x) / dx
+        ty1 = (y_min - y) / dy
+        ty2 = (y_max - y) / dy
+
+    # rays parallel to an axis never cross that pair of sides, they are either always or never between them
+    inside_x = (x >= x_min) & (x <= x_max)
+    inside_y = (y >= y_min) & (y <= y_max)
+    parallel_x = dx == 0
+    parallel_y = dy == 0
+    near_x = np.where(parallel_x, np.where(inside_x, -np.inf, np.inf), np.minimum(tx1, tx2))
+    far_x = np.where(parallel_x, np.where(inside_x, np.inf, -np.inf), np.maximum(tx1, tx2))
+    near_y = np.where(parallel_y, np.where(inside_y, -np.inf, np.inf), np.minimum(ty1, ty2))
+    far_y = np.where(parallel_y, np.where(inside_y, np.inf, -np.inf), np.maximum(ty1, ty2))
+
+    return np.maximum(near_x, near_y), np.minimum(far_x, far_y)
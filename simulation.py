@@ -0,0 +1,148 @@
+import threading
+import time
+
+from arena import Arena
+from headless import STEPS, finish_generation
+
+"""
+Notes:
+    - The simulation runs in its own thread as fast as it can (or capped at tick_rate ticks per
+    second) while the window only looks at the latest snapshot, so drawing never holds training back.
+    - A snapshot is a copy of the agents' state taken every render_every ticks (or generations when
+    render_unit is "generation"); publishing one is a single attribute swap, so the ui never needs
+    the lock to read it.
+"""
+
+# tick rates stepped through by faster/slower, None runs as fast as possible
+SPEEDS = [5, 10, 20, 40, 80, 160, 320, 640, None]
+RENDER_UNITS = ("tick", "generation")
+
+class SimulationThread(threading.Thread):
+    """Runs an arena's generations in a background thread and publishes snapshots for the ui.
+
+    Attributes:
+        arena: the populated arena being evolved
+        steps: ticks per generation
+        tick_rate: maximum ticks per second, None for no limit
+        render_every: publish a snapshot every this many ticks (or generations)
+        render_unit: "tick" or "generation"
+        on_tick: called with (arena, tick) before every tick, e.g. to move the goal
+        on_generation: called with (generation, record) after every generation
+        tick: ticks run so far in the current generation
+        highest: most agents that finished any one generation
+        snapshot: dict with the copied agent state, generation, tick, highest and finished count
+        lock: held while the arena is being changed, take it before touching the arena from another thread
+    """
+    def __init__(self, arena:Arena, steps:int=STEPS, tick_rate:int=None, render_every:int=1,
+                 render_unit:str="tick", on_tick=None, on_generation=None):
+        super().__init__(daemon=True)
+        if render_unit not in RENDER_UNITS:
+            raise ValueError(f"render_unit must be one of {RENDER_UNITS}, got {render_unit!r}")
+        self.arena = arena
+        self.steps = steps
+        self.tick_rate = tick_rate
+        self.render_every = render_every
+        self.render_unit = render_unit
+        self.on_tick = on_tick
+        self.on_generation = on_generation
+        self.tick = 0
+        self.ticks = 0
+        self.highest = 0
+        self.generation_start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.running = threading.Event()
+        self.stopped = False
+        self.snapshot = None
+        self.publish()
+
+    def run(self) -> None:
+        while not self.stopped:
+            if not self.running.wait(0.1):
+                continue
+            start = time.perf_counter()
+            self.step()
+            if self.tick_rate is not None:
+                time.sleep(max(0.0, 1 / self.tick_rate - (time.perf_counter() - start)))
+
+    def step(self) -> None:
+        """Run one tick, and the generation turnover when it was the last tick of the generation"""
+        with self.lock:
+            arena = self.arena
+            if self.tick == 0:
+                self.generation_start = time.perf_counter()
+            if self.on_tick is not None:
+                self.on_tick(arena, self.tick)
+            arena.update_agents()
+            self.tick += 1
+            self.ticks += 1
+            if self.render_unit == "tick" and self.ticks % self.render_every == 0:
+                self.publish()
+
+            # the generation is over once its ticks ran out or no agent is moving any more
+            if self.tick == self.steps or not arena.state.active.any():
+                with arena.profiler.phase("fitness"):
+                    arena.fitness()
+                # show where the agents ended up before selection replaces them
+                if self.render_unit == "generation" and (arena.generation + 1) % self.render_every == 0:
+                    self.publish()
+                record = finish_generation(arena, self.generation_start)
+                self.highest = max(self.highest, record["finished"])
+                self.tick = 0
+                if self.on_generation is not None:
+                    self.on_generation(arena.generation, record)
+
+    def publish(self) -> None:
+        """Copy the agents' state into a new snapshot"""
+        state = self.arena.state
+        self.snapshot = {
+            "state": state.take(slice(None)),
+            "generation": self.arena.generation,
+            "tick": self.tick,
+            "highest": self.highest,
+            "finished": int(state.finished.sum()),
+        }
+
+    def pause(self) -> None:
+        self.running.clear()
+
+    def resume(self) -> None:
+        self.running.set()
+
+    def toggle(self) -> bool:
+        """Pause or resume the simulation and return whether it is running now"""
+        if self.running.is_set():
+            self.pause()
+        else:
+            self.resume()
+        return self.running.is_set()
+
+    def stop(self) -> None:
+        self.stopped = True
+        self.running.set()
+
+    def faster(self) -> int:
+        """Raise the tick rate to the next of SPEEDS and return it"""
+        index = SPEEDS.index(self.tick_rate) if self.tick_rate in SPEEDS else len(SPEEDS) - 1
+        self.tick_rate = SPEEDS[min(index + 1, len(SPEEDS) - 1)]
+        return self.tick_rate
+
+    def slower(self) -> int:
+        """Lower the tick rate to the previous of SPEEDS and return it"""
+        index = SPEEDS.index(self.tick_rate) if self.tick_rate in SPEEDS else len(SPEEDS) - 1
+        self.tick_rate = SPEEDS[max(index - 1, 0)]
+        return self.tick_rate
+
+    def skip_more(self) -> int:
+        """Double the number of ticks (or generations) between snapshots and return it"""
+        self.render_every *= 2
+        return self.render_every
+
+    def skip_less(self) -> int:
+        """Halve the number of ticks (or generations) between snapshots and return it"""
+        self.render_every = max(self.render_every // 2, 1)
+        return self.render_every
+
+    def toggle_render_unit(self) -> str:
+        """Switch between snapshots every few ticks and every few generations"""
+        self.render_unit = RENDER_UNITS[1 - RENDER_UNITS.index(self.render_unit)]
+        return self.render_unit
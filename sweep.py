@@ -0,0 +1,211 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from config import RunConfig
+from headless import run_generation
+from scenarios import ScenarioEvaluator
+from seeding import make_rng
+
+"""
+Notes:
+    - A sweep runs many RunConfigs headless, one per task of a process pool, and collects one row
+    per run: its settings, the generation it first had target agents finish (solved_at, None if it
+    never did), and its throughput.
+    - Runs stop at the generation they solve by default, so the cost of a sweep goes to the
+    configs that are still struggling.
+    - Every config is run with several seeds, summarize averages them into one row per config,
+    ranked by how often and how fast it solved. Unsolved runs count as generations + 1 there.
+"""
+
+COLUMNS = ["solved_at", "generations_run", "ticks", "seconds", "ticks_per_second", "highest", "best_fitness"]
+
+def grid(space:dict, base:RunConfig=None) -> list:
+    """Return a config for every combination of the values in space (setting -> list of values)"""
+    base = RunConfig() if base is None else base
+    names = list(space)
+    return [base.replace(**dict(zip(names, values))) for values in itertools.product(*(space[name] for name in names))]
+
+def random_search(space:dict, count:int, rng, base:RunConfig=None) -> list:
+    """Return count configs with every setting in space drawn at random
+
+    A list of values is drawn from uniformly, a (low, high) tuple of ints as an integer in
+    [low, high] and of floats as a float between them.
+    """
+    base = RunConfig() if base is None else base
+    configs = []
+    for _ in range(count):
+        changes = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                if isinstance(low, int) and isinstance(high, int):
+                    changes[name] = int(rng.integers(low, high + 1))
+                else:
+                    changes[name] = float(rng.uniform(low, high))
+            else:
+                changes[name] = values[int(rng.integers(len(values)))]
+        configs.append(base.replace(**changes))
+    return configs
+
+def with_seeds(configs:list, seeds:list) -> list:
+    """Return every config once per seed"""
+    return [config.replace(seed=seed) for config in configs for seed in seeds]
+
+def run_config(config:RunConfig, stop_when_solved:bool=True) -> dict:
+    """Worker entry point: evolve an arena built from config and return its row of the results table"""
+    arena = config.build_arena()
+    evaluator = ScenarioEvaluator(config.scenarios, config.random_goal) if config.scenarios > 1 else None
+    start = time.perf_counter()
+    solved_at = None
+    ticks = 0
+    highest = 0
+    record = None
+    for _ in range(config.generations):
+        record = run_generation(arena, config.steps, evaluator)
+        ticks += record["ticks"]
+        highest = max(highest, record["finished"])
+        if solved_at is None and record["finished"] >= config.target:
+            solved_at = arena.generation
+            if stop_when_solved:
+                break
+    elapsed = time.perf_counter() - start
+    return {
+        **config.as_dict(),
+        "solved_at": solved_at,
+        "generations_run": arena.generation,
+        "ticks": ticks,
+        "seconds": elapsed,
+        "ticks_per_second": ticks / elapsed if elapsed else float("inf"),
+        "highest": highest,
+        "best_fitness": record["best_fitness"] if record else 0.0,
+    }
+
+def sweep(configs:list, workers:int=None, stop_when_solved:bool=True, callback=None) -> list:
+    """Run every config in a process pool and return their rows in the order they were given
+
+    Keyword arguments:
+    configs -- the RunConfigs to run
+    workers -- how many processes to use (default all cores)
+    stop_when_solved -- end a run at the generation it is solved in
+    callback -- called with every row as soon as its run is done
+    """
+    workers = min(workers or os.cpu_count() or 1, max(len(configs), 1))
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for row in executor.map(run_config, configs, itertools.repeat(stop_when_solved)):
+            if callback is not None:
+                callback(row)
+            rows.append(row)
+    return rows
+
+def summarize(rows:list) -> list:
+    """Average the runs of every config over its seeds, best config first
+
+    Configs are ranked by the share of seeds that solved, then by mean generations to solve.
+    """
+    groups = {}
+    for row in rows:
+        settings = {name: row[name] for name in RunConfig.FIELDS if name != "seed"}
+        groups.setdefault(json.dumps(settings, sort_keys=True), (settings, []))[1].append(row)
+
+    res = []
+    for settings, runs in groups.values():
+        solved = [run["solved_at"] for run in runs if run["solved_at"] is not None]
+        res.append({
+            **settings,
+            "runs": len(runs),
+            "solve_rate": len(solved) / len(runs),
+            "mean_solved_at": float(np.mean([run["generations"] + 1 if run["solved_at"] is None else run["solved_at"] for run in runs])),
+            "ticks_per_second": float(np.mean([run["ticks_per_second"] for run in runs])),
+        })
+    res.sort(key=lambda row: (-row["solve_rate"], row["mean_solved_at"], -row["ticks_per_second"]))
+    return res
+
+def write_table(rows:list, path:str) -> None:
+    """Save rows to a .csv file, or JSON lines for any other extension"""
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else [])
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({name: "-".join(map(str, value)) if isinstance(value, tuple) else value for name, value in row.items()})
+    else:
+        with open(path, "w") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+def format_table(rows:list, columns:list) -> str:
+    """Format the given columns of rows as an aligned text table"""
+    def cell(value):
+        if isinstance(value, float):
+            return f"{value:.3g}"
+        if isinstance(value, tuple):
+            return "-".join(map(str, value))
+        return str(value)
+
+    cells = [columns] + [[cell(row[name]) for name in columns] for row in rows]
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+    return "\n".join("  ".join(value.rjust(width) for value, width in zip(line, widths)) for line in cells)
+
+def parse_space(items:list) -> dict:
+    """Parse name=v1,v2,... (values to try) and name=low:high (a range to sample) items"""
+    space = {}
+    for item in items:
+        name, _, text = item.partition("=")
+        if ":" in text:
+            low, high = (RunConfig.parse(name, value) for value in text.split(":"))
+            space[name] = (low, high)
+        else:
+            space[name] = [RunConfig.parse(name, value) for value in text.split(",")]
+    return space
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a grid or random search of configs headless across processes")
+    parser.add_argument("space", nargs="+", help="settings to sweep, name=v1,v2,... or name=low:high (random search only), "
+                                                 f"names are those of RunConfig: {', '.join(RunConfig.FIELDS)}")
+    parser.add_argument("--random", type=int, default=None, help="draw this many random configs instead of running the whole grid")
+    parser.add_argument("--seeds", type=int, default=3, help="run every config with this many seeds")
+    parser.add_argument("--generations", type=int, default=RunConfig.FIELDS["generations"], help="generations every run lasts at most")
+    parser.add_argument("--target", type=int, default=RunConfig.FIELDS["target"], help="finished agents a generation needs to count as solved")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--keep-going", action="store_true", help="run every config for all generations even once it is solved")
+    parser.add_argument("--output", default=None, help="save every run to this .csv or .jsonl file")
+    parser.add_argument("--summary", default=None, help="save the per config summary to this .csv or .jsonl file")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random search")
+    args = parser.parse_args()
+
+    space = parse_space(args.space)
+    base = RunConfig(generations=args.generations, target=args.target)
+    if args.random:
+        configs = random_search(space, args.random, make_rng(args.seed), base)
+    else:
+        if any(isinstance(values, tuple) for values in space.values()):
+            parser.error("ranges (name=low:high) need --random")
+        configs = grid(space, base)
+    configs = with_seeds(configs, list(range(args.seeds)))
+
+    swept = list(space)
+
+    def report(row):
+        settings = ", ".join(f"{name}={format_table([row], [name]).splitlines()[1].strip()}" for name in swept + ["seed"])
+        solved = f"solved at generation {row['solved_at']}" if row["solved_at"] is not None else "not solved"
+        print(f"{settings}: {solved}, {row['ticks_per_second']:.0f} ticks/s")
+
+    print(f"Running {len(configs)} runs")
+    rows = sweep(configs, args.workers, not args.keep_going, callback=report)
+    summary = summarize(rows)
+    print(format_table(summary, swept + ["runs", "solve_rate", "mean_solved_at", "ticks_per_second"]))
+    if args.output:
+        write_table(rows, args.output)
+    if args.summary:
+        write_table(summary, args.summary)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import numpy as np
+
+class WorldState:
+    """Per-agent state stored as contiguous arrays, one row per agent.
+
+    Attributes:
+        x: x coordinates of the agents
+        y: y coordinates of the agents
+        direction: directions the agents are facing, in degrees
+        speed: speeds of the agents
+        fitness: fitness of the agents as of the last Arena.fitness call
+        alive: whether the agent is still inside the arena
+        finished: whether the agent has reached the goal
+    """
+    FIELDS = (
+        ("x", float),
+        ("y", float),
+        ("direction", int),
+        ("speed", float),
+        ("fitness", float),
+        ("alive", bool),
+        ("finished", bool),
+    )
+
+    def __init__(self, count:int=0):
+        for name, dtype in self.FIELDS:
+            setattr(self, name, np.zeros(count, dtype=dtype))
+        self.alive[:] = True
+
+    def __len__(self):
+        return len(self.x)
+
+    @property
+    def active(self) -> np.ndarray:
+        """Mask of the agents that are still moving around (alive and not yet at the goal)"""
+        return self.alive & ~self.finished
+
+    def extend(self, count:int) -> np.ndarray:
+        """Append count zeroed, alive rows and return their indices"""
+        start = len(self)
+        for name, dtype in self.FIELDS:
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros(count, dtype=dtype)]))
+        self.alive[start:] = True
+        return np.arange(start, start + count)
+
+    def take(self, rows):
+        """Return a new state holding copies of the given rows, in the given order"""
+        res = WorldState()
+        for name, _ in self.FIELDS:
+            setattr(res, name, getattr(self, name)[rows])
+        return res
+
+    def keep(self, rows) -> None:
+        """Keep only the given rows, in the given order"""
+        for name, _ in self.FIELDS:
+            setattr(self, name, getattr(self, name)[rows])
+
+    def copy_row(self, row:int, other, other_row:int) -> None:
+        """Copy a row of another state into a row of this one"""
+        for name, _ in self.FIELDS:
+            getattr(self, name)[row] = getattr(other, name)[other_row]
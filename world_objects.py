@@ -0,0 +1,350 @@
+import numpy as np
+
+from sensors import slab_interval
+
+"""
+Notes:
+    - Extra goals and obstacles (rectangles and circles) are bucketed into a uniform grid of square
+    cells over the arena, each cell lists the objects overlapping it.
+    - Ray queries walk the grid cell by cell (Amanatides & Woo) for all rays at once and only test
+    the objects listed in the cells a ray passes through; point queries only test the objects of
+    the cell a point is in. Sensing cost therefore depends on how crowded the cells are, not on
+    how many objects the world holds.
+    - Agents are indexed separately by AgentGrid, which is rebuilt from their positions every tick
+    since they move; its cells are as wide as the agents' sight, so finding the agents near a point
+    only looks at the 3 x 3 cells around it.
+"""
+
+RECT = 0
+CIRCLE = 1
+KINDS = {"obstacle": 0, "goal": 1}
+CELL_SIZE = 50
+SPEC_FIELDS = {"rect": 4, "circle": 3}
+# radius of an agent's body as other agents see it, the size of the dot game_ui draws
+AGENT_RADIUS = 5
+
+class WorldObjects:
+    """Goals and obstacles in an arena, indexed by a uniform grid.
+
+    Attributes:
+        width: width of the area covered by the grid
+        height: height of the area covered by the grid
+        cell_size: side length of a grid cell
+        shape: RECT or CIRCLE per object
+        kind: index into KINDS per object
+        bounds: (objects x 4) array of x_min, y_min, x_max, y_max per object (bounding box for circles)
+        radius: radius per object, 0 for rectangles
+        cells: (cells x max objects per cell) table of object ids per grid cell, padded with -1
+        counts: number of objects listed in each grid cell
+        smallest: shortest side of any object's bounding box, inf without objects
+    """
+    GOAL = KINDS["goal"]
+    OBSTACLE = KINDS["obstacle"]
+
+    def __init__(self, width, height, cell_size=CELL_SIZE):
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.cols = max(int(np.ceil(width / cell_size)), 1)
+        self.rows = max(int(np.ceil(height / cell_size)), 1)
+        self.shape = np.zeros(0, dtype=int)
+        self.kind = np.zeros(0, dtype=int)
+        self.bounds = np.zeros((0, 4))
+        self.radius = np.zeros(0)
+        self.smallest = np.inf
+        self.cells = None
+        self.counts = None
+
+    def __len__(self):
+        return len(self.shape)
+
+    def add_rect(self, x, y, width, height, kind:str="obstacle") -> int:
+        """Add a rectangle with its top left corner at (x, y) and return its id"""
+        return self.add(RECT, kind, (x, y, x + width, y + height), 0)
+
+    def add_circle(self, x, y, radius, kind:str="obstacle") -> int:
+        """Add a circle centered on (x, y) and return its id"""
+        return self.add(CIRCLE, kind, (x - radius, y - radius, x + radius, y + radius), radius)
+
+    def add_spec(self, spec:str) -> list:
+        """Add the objects described by spec and return their ids
+
+        spec lists objects separated by ";", each "rect X Y WIDTH HEIGHT" or "circle X Y RADIUS",
+        optionally followed by a kind from KINDS (obstacle by default),
+        e.g. "rect 300 300 100 20; circle 700 200 40 goal".
+        """
+        ids = []
+        for item in filter(None, (part.strip() for part in spec.split(";"))):
+            shape, *fields = item.split()
+            kind = fields.pop() if fields and fields[-1] in KINDS else "obstacle"
+            if SPEC_FIELDS.get(shape) != len(fields):
+                raise ValueError(f"expected 'rect X Y WIDTH HEIGHT [kind]' or 'circle X Y RADIUS [kind]', got {item!r}")
+            try:
+                values = [float(value) for value in fields]
+            except ValueError:
+                raise ValueError(f"object sizes must be numbers, got {item!r}") from None
+            ids.append(self.add_rect(*values, kind) if shape == "rect" else self.add_circle(*values, kind))
+        return ids
+
+    def add(self, shape:int, kind:str, bounds:tuple, radius) -> int:
+        self.shape = np.append(self.shape, shape)
+        self.kind = np.append(self.kind, KINDS[kind])
+        self.bounds = np.vstack([self.bounds, np.asarray(bounds, dtype=float)])
+        self.radius = np.append(self.radius, float(radius))
+        self.smallest = min(self.smallest, bounds[2] - bounds[0], bounds[3] - bounds[1])
+        self.cells = None
+        return len(self) - 1
+
+    def clear(self) -> None:
+        self.__init__(self.width, self.height, self.cell_size)
+
+    def build_index(self) -> None:
+        """Bucket every object into the grid cells its bounding box overlaps"""
+        col_lo, row_lo = self.cell_of(self.bounds[:, 0], self.bounds[:, 1])
+        col_hi, row_hi = self.cell_of(self.bounds[:, 2], self.bounds[:, 3])
+        buckets = [[] for _ in range(self.cols * self.rows)]
+        for obj in range(len(self)):
+            for row in range(row_lo[obj], row_hi[obj] + 1):
+                for col in range(col_lo[obj], col_hi[obj] + 1):
+                    buckets[row * self.cols + col].append(obj)
+
+        self.counts = np.fromiter(map(len, buckets), dtype=int, count=len(buckets))
+        self.cells = np.full((len(buckets), max(self.counts.max(), 1)), -1, dtype=int)
+        for cell, objs in enumerate(buckets):
+            self.cells[cell, :len(objs)] = objs
+
+    def cell_of(self, x, y) -> tuple:
+        """Return the (column, row) of the cells containing the points, clamped to the grid"""
+        col = np.clip(np.floor(np.asarray(x) / self.cell_size), 0, self.cols - 1).astype(int)
+        row = np.clip(np.floor(np.asarray(y) / self.cell_size), 0, self.rows - 1).astype(int)
+        return col, row
+
+    def candidates(self, col, row, kind:str=None) -> np.ndarray:
+        """Return the ids of the objects listed in each cell, -1 where there is none (or it is of another kind)"""
+        if self.cells is None:
+            self.build_index()
+        res = self.cells[row * self.cols + col]
+        if kind is not None:
+            res = np.where((res >= 0) & (self.kind[res] == KINDS[kind]), res, -1)
+        return res
+
+    def contains(self, x, y, kind:str=None) -> np.ndarray:
+        """Return a mask of the points that lie strictly inside any object (of the given kind)"""
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if not len(self) or not x.size:
+            return np.zeros(x.shape, dtype=bool)
+        col, row = self.cell_of(x, y)
+        ids = self.candidates(col, row, kind)
+        safe = np.maximum(ids, 0)
+        px = x[..., None]
+        py = y[..., None]
+        bounds = self.bounds[safe]
+        in_box = (px > bounds[..., 0]) & (px < bounds[..., 2]) & (py > bounds[..., 1]) & (py < bounds[..., 3])
+        center_x = (bounds[..., 0] + bounds[..., 2]) / 2
+        center_y = (bounds[..., 1] + bounds[..., 3]) / 2
+        in_circle = (px - center_x) ** 2 + (py - center_y) ** 2 < self.radius[safe] ** 2
+        inside = np.where(self.shape[safe] == CIRCLE, in_circle, in_box)
+        return (inside & (ids >= 0)).any(axis=-1)
+
+    def cast(self, x, y, dx, dy, max_length) -> tuple:
+        """Return the distance to the first object along every ray and that object's kind
+
+        Rays that hit nothing within max_length get an infinite distance and a kind of -1. Only the
+        parts of objects that lie over the grid (the arena) can be seen.
+
+        Keyword arguments:
+        x -- x coordinates the rays start from (any shape broadcastable with dx)
+        y -- y coordinates the rays start from
+        dx -- x components of the unit direction of every ray
+        dy -- y components of the unit direction of every ray
+        max_length -- how far along each ray to look
+        """
+        x, y, dx, dy = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (x, y, dx, dy)))
+        shape = x.shape
+        x, y, dx, dy = x.ravel(), y.ravel(), dx.ravel(), dy.ravel()
+        best = np.full(len(x), np.inf)
+        best_kind = np.full(len(x), -1)
+        if not len(self) or not len(x):
+            return best.reshape(shape), best_kind.reshape(shape)
+        if self.cells is None:
+            self.build_index()
+
+        # clip each ray to the part that runs over the grid
+        grid_near, grid_far = slab_interval(x, y, dx, dy, 0, 0, self.cols * self.cell_size, self.rows * self.cell_size)
+        live = (grid_near <= grid_far) & (grid_far >= 0) & (grid_near <= max_length)
+        end = np.minimum(grid_far, max_length)
+        t = np.maximum(grid_near, 0)
+        col, row = self.cell_of(x + t * dx, y + t * dy)
+
+        # distance along the ray to the next vertical / horizontal cell boundary and between boundaries
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step_col = np.where(dx > 0, 1, -1)
+            step_row = np.where(dy > 0, 1, -1)
+            next_x = (col + (dx > 0)) * self.cell_size
+            next_y = (row + (dy > 0)) * self.cell_size
+            t_col = np.where(dx != 0, (next_x - x) / dx, np.inf)
+            t_row = np.where(dy != 0, (next_y - y) / dy, np.inf)
+            delta_col = np.where(dx != 0, self.cell_size / np.abs(dx), np.inf)
+            delta_row = np.where(dy != 0, self.cell_size / np.abs(dy), np.inf)
+
+        rays = np.flatnonzero(live)
+        while len(rays):
+            # only rays over occupied cells need testing, and only as many columns as the fullest of those cells
+            cell = row[rays] * self.cols + col[rays]
+            occupied = self.counts[cell] > 0
+            if occupied.any():
+                hits = rays[occupied]
+                ids = self.cells[cell[occupied], :self.counts[cell[occupied]].max()]
+                distance = self.intersect(ids, x[hits, None], y[hits, None], dx[hits, None], dy[hits, None], max_length)
+                nearest = distance.argmin(axis=1)
+                nearest_distance = distance[np.arange(len(hits)), nearest]
+                closer = nearest_distance < best[hits]
+                best[hits[closer]] = nearest_distance[closer]
+                best_kind[hits[closer]] = self.kind[ids[closer, nearest[closer]]]
+
+            # step into the next cell, stop once the closest hit is before it or the ray has run out
+            leave = np.minimum(t_col[rays], t_row[rays])
+            along_col = t_col[rays] < t_row[rays]
+            col[rays] += np.where(along_col, step_col[rays], 0)
+            row[rays] += np.where(along_col, 0, step_row[rays])
+            t_col[rays] += np.where(along_col, delta_col[rays], 0)
+            t_row[rays] += np.where(along_col, 0, delta_row[rays])
+            done = (best[rays] <= leave) | (leave >= end[rays])
+            done |= (col[rays] < 0) | (col[rays] >= self.cols) | (row[rays] < 0) | (row[rays] >= self.rows)
+            rays = rays[~done]
+
+        return best.reshape(shape), best_kind.reshape(shape)
+
+    def intersect(self, ids, x, y, dx, dy, max_length) -> np.ndarray:
+        """Return the distance along each ray to each candidate object, inf for misses and padding"""
+        near, far = self.interval(ids, x, y, dx, dy)
+        hit = (ids >= 0) & (near <= far) & (far >= 0) & (near <= max_length)
+        return np.where(hit, np.maximum(near, 0), np.inf)
+
+    def interval(self, ids, x, y, dx, dy) -> tuple:
+        """Return the distances along each ray at which it enters and leaves each object (ids -1 count as object 0)
+
+        Like sensors.slab_interval, the ray misses an object when the entry distance is greater than the exit distance.
+        """
+        safe = np.maximum(ids, 0)
+        bounds = self.bounds[safe]
+        near, far = slab_interval(x, y, dx, dy, bounds[..., 0], bounds[..., 1], bounds[..., 2], bounds[..., 3])
+
+        # circles: solve |o + t d - c| = r for unit d
+        center_x = (bounds[..., 0] + bounds[..., 2]) / 2
+        center_y = (bounds[..., 1] + bounds[..., 3]) / 2
+        b = (x - center_x) * dx + (y - center_y) * dy
+        c = (x - center_x) ** 2 + (y - center_y) ** 2 - self.radius[safe] ** 2
+        disc = b ** 2 - c
+        root = np.sqrt(np.maximum(disc, 0))
+        circle = self.shape[safe] == CIRCLE
+        near = np.where(circle, np.where(disc >= 0, -b - root, np.inf), near)
+        far = np.where(circle, np.where(disc >= 0, -b + root, -np.inf), far)
+        return near, far
+
+
+class AgentGrid:
+    """Positions of the agents, indexed by a uniform grid that update rebuilds every tick.
+
+    Cells are as wide as the agents' sight, so every agent within sight of a point is in one of the
+    3 x 3 cells around the point's cell. Agents only see agents of their own world (the same
+    scenario of a scenario grid).
+
+    Attributes:
+        sight: how far agents see each other, also the side length of a cell
+        radius: radius of an agent's body
+        ids: the indexed agents (rows of the arena's state), sorted by cell
+        x: x coordinate of every agent in ids
+        y: y coordinate of every agent in ids
+        world: world of every agent in ids
+        starts: index into ids of the first agent of every cell, plus one entry for the end of the last cell
+    """
+    # the 3 x 3 block of cells around a cell
+    AROUND_COL = np.tile([-1, 0, 1], 3)
+    AROUND_ROW = np.repeat([-1, 0, 1], 3)
+
+    def __init__(self, width, height, sight, radius=AGENT_RADIUS):
+        self.sight = sight
+        self.radius = radius
+        self.cols = max(int(np.ceil(width / sight)), 1)
+        self.rows = max(int(np.ceil(height / sight)), 1)
+        self.update(np.zeros(0), np.zeros(0), np.zeros(0, dtype=int))
+
+    def cell_of(self, x, y) -> tuple:
+        """Return the (column, row) of the cells containing the points, clamped to the grid"""
+        col = np.clip(np.floor(np.asarray(x) / self.sight), 0, self.cols - 1).astype(int)
+        row = np.clip(np.floor(np.asarray(y) / self.sight), 0, self.rows - 1).astype(int)
+        return col, row
+
+    def update(self, x, y, ids, world=None) -> None:
+        """Replace the indexed agents with the agents ids at (x, y), sorting them by cell"""
+        col, row = self.cell_of(x, y)
+        cell = row * self.cols + col
+        order = np.argsort(cell, kind="stable")
+        self.ids = np.asarray(ids)[order]
+        self.x = np.asarray(x, dtype=float)[order]
+        self.y = np.asarray(y, dtype=float)[order]
+        self.world = np.zeros(len(order), dtype=int) if world is None else np.asarray(world)[order]
+        self.starts = np.searchsorted(cell[order], np.arange(self.cols * self.rows + 1))
+
+    def neighbours(self, x, y, world=None) -> tuple:
+        """Return (point, agent) index pairs of the indexed agents within sight of every point
+
+        agent indexes ids, x and y. With world given (one per point) only agents of the point's
+        world are returned.
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        col, row = self.cell_of(x, y)
+        col = (col[:, None] + self.AROUND_COL).ravel()
+        row = (row[:, None] + self.AROUND_ROW).ravel()
+        valid = (col >= 0) & (col < self.cols) & (row >= 0) & (row < self.rows)
+        cell = np.where(valid, row * self.cols + col, 0)
+        first = self.starts[cell]
+        count = np.where(valid, self.starts[cell + 1] - first, 0)
+
+        # one pair per agent in each of the cells around every point
+        pair_cell = np.repeat(np.arange(len(cell)), count)
+        agent = np.arange(len(pair_cell)) + np.repeat(first - (np.cumsum(count) - count), count)
+        point = pair_cell // len(self.AROUND_COL)
+        near = (self.x[agent] - x[point]) ** 2 + (self.y[agent] - y[point]) ** 2 <= self.sight ** 2
+        if world is not None:
+            near &= self.world[agent] == np.asarray(world)[point]
+        return point[near], agent[near]
+
+    def cast(self, x, y, dx, dy, world=None) -> np.ndarray:
+        """Return the distance along every ray to the nearest body of another agent within sight, inf where there is none
+
+        A ray that starts inside a body doesn't see it, which keeps agents from seeing their own
+        body and agents that overlap (all agents at the start of a generation) from blinding each other.
+
+        Keyword arguments:
+        x -- (agents) x coordinates the rays start from
+        y -- (agents) y coordinates the rays start from
+        dx -- (agents x rays) x components of the unit direction of every ray
+        dy -- (agents x rays) y components of the unit direction of every ray
+        world -- the world of every casting agent, see neighbours
+        """
+        res = np.full(np.shape(dx), np.inf)
+        point, agent = self.neighbours(x, y, world)
+        offset_x = np.asarray(x)[point] - self.x[agent]
+        offset_y = np.asarray(y)[point] - self.y[agent]
+        c = offset_x ** 2 + offset_y ** 2 - self.radius ** 2
+        outside = c > 0
+        point, agent, c = point[outside], agent[outside], c[outside, None]
+        if not len(point):
+            return res
+
+        # solve |o + t d - c| = r for unit d like WorldObjects.interval, from outside the body the
+        # ray hits it ahead exactly when it points towards the center (b < 0) and doesn't pass by it
+        b = offset_x[outside, None] * dx[point] + offset_y[outside, None] * dy[point]
+        disc = b ** 2 - c
+        hit = (disc >= 0) & (b < 0)
+        distance = np.full(b.shape, np.inf)
+        distance[hit] = -b[hit] - np.sqrt(disc[hit])
+
+        # pairs come grouped by point, so the nearest hit of every point is a minimum over its run of pairs
+        first = np.flatnonzero(np.r_[True, point[1:] != point[:-1]])
+        res[point[first]] = np.minimum.reduceat(distance, first, axis=0)
+        return res